@@ -0,0 +1,110 @@
+"""Micro-benchmark for diagram type detection.
+
+Compares the shared classifier (uncached and cached) with the two keyword
+scans it replaced, on 1 KB, 100 KB and 1 MB sources, and reports how often
+each agrees with the snippet corpus categories.
+
+    poetry run python benchmarks/bench_classifier.py
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from bench_encoder import SIZES, make_source, throughput  # noqa: E402
+
+from codoc_in_plantuml.states.editor_state import snippets_by_category  # noqa: E402
+from codoc_in_plantuml.utils.diagram_types import _classify, classify  # noqa: E402
+
+
+def legacy_document_type(code: str) -> str:
+    """The former ``DocumentState.detect_type``."""
+    code_lower = code.lower()
+    if "participant" in code_lower or "sequence" in code_lower or "->" in code_lower:
+        return "Sequence"
+    elif "class" in code_lower or "interface" in code_lower:
+        return "Class"
+    elif "usecase" in code_lower or "actor" in code_lower:
+        return "Use Case"
+    elif "activity" in code_lower or ":start" in code_lower or "fork" in code_lower:
+        return "Activity"
+    elif "state" in code_lower or "[*]" in code_lower:
+        return "State"
+    elif "component" in code_lower or "database" in code_lower:
+        return "Component"
+    elif "json" in code_lower:
+        return "JSON"
+    elif "yaml" in code_lower:
+        return "YAML"
+    elif "mindmap" in code_lower:
+        return "MindMap"
+    elif "gantt" in code_lower:
+        return "Gantt"
+    return "Unknown"
+
+
+def legacy_plantuml_state_type(code: str) -> str:
+    """The former ``PlantUMLState.detected_type``."""
+    code_lower = code.lower()
+    if "class " in code_lower:
+        return "Class"
+    elif "actor " in code_lower or "participant " in code_lower or "->" in code_lower:
+        return "Sequence"
+    elif "usecase " in code_lower:
+        return "Use Case"
+    elif "start" in code_lower and "stop" in code_lower:
+        return "Activity"
+    elif "package " in code_lower or "node " in code_lower:
+        return "Component"
+    elif "[*]" in code_lower:
+        return "State"
+    elif "object " in code_lower:
+        return "Object"
+    return "Unknown"
+
+
+def make_class_source(size: int) -> str:
+    """A class diagram whose only class marker is its last line.
+
+    Past ``_HEAD_CHARS`` that line is no longer scanned, so ``classify``
+    reports these as sequence diagrams and the timings show the flat cost.
+    """
+    body = make_source(size).replace("@enduml", "Service1 <|-- Service2\n@enduml")
+    return body
+
+
+def agreement(fn) -> float:
+    """Share of corpus snippets whose detected type matches their category."""
+    hits = total = 0
+    for category, codes in snippets_by_category().items():
+        for code in codes:
+            detected = fn(code).lower()
+            hits += detected[:4] in category.lower() or category.lower()[:4] in detected
+            total += 1
+    return hits / total
+
+
+def main() -> None:
+    classifiers = {
+        "classify (uncached)": lambda code: _classify(code).type,
+        "classify (cached)": lambda code: classify(code).type,
+        "legacy DocumentState": legacy_document_type,
+        "legacy PlantUMLState": legacy_plantuml_state_type,
+    }
+    print(f"{'size':>8}  {'input':<10} {'classifier':<22} {'MB/s':>9}")
+    for label, size in SIZES.items():
+        inputs = {"sequence": make_source(size), "class": make_class_source(size)}
+        for name, text in inputs.items():
+            for classifier, fn in classifiers.items():
+                print(
+                    f"{label:>8}  {name:<10} {classifier:<22} "
+                    f"{throughput(fn, text):>9.2f}"
+                )
+    print(f"\n{'classifier':<22} {'corpus agreement':>17}")
+    for classifier, fn in classifiers.items():
+        print(f"{classifier:<22} {agreement(fn):>17.0%}")
+
+
+if __name__ == "__main__":
+    main()
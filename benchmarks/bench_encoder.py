@@ -0,0 +1,108 @@
+"""Micro-benchmark for the PlantUML text encoder.
+
+Compares the shared table-driven encoder against the previous per-character
+implementations on 1 KB, 100 KB and 1 MB sources.
+
+    poetry run python benchmarks/bench_encoder.py
+"""
+
+import base64
+import random
+import sys
+import time
+import zlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from codoc_in_plantuml.utils.encoding import decode, encode  # noqa: E402
+
+SIZES = {"1 KB": 1024, "100 KB": 100 * 1024, "1 MB": 1024 * 1024}
+
+
+def legacy_plantuml_encode(text: str) -> str:
+    """The former ``PlantUML.encode``: string concatenation per 3-byte group."""
+
+    def encode6bit(b: int) -> str:
+        if b < 10:
+            return chr(48 + b)
+        b -= 10
+        if b < 26:
+            return chr(65 + b)
+        b -= 26
+        if b < 26:
+            return chr(97 + b)
+        b -= 26
+        return "-" if b == 0 else "_"
+
+    compressed = zlib.compress(text.encode("utf-8"), 9)[2:-4]
+    compressed += b"\0" * (-len(compressed) % 3)
+    result = ""
+    for i in range(0, len(compressed), 3):
+        b1, b2, b3 = compressed[i], compressed[i + 1], compressed[i + 2]
+        result += encode6bit(b1 >> 2)
+        result += encode6bit((b1 & 3) << 4 | b2 >> 4)
+        result += encode6bit((b2 & 15) << 2 | b3 >> 6)
+        result += encode6bit(b3 & 63)
+    return result
+
+
+def legacy_state_encode(text: str) -> str:
+    """The former ``plantuml_state.plantuml_encode``: alphabet lookup per char."""
+    plantuml_alphabet = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz-_"
+    standard_alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+    compressed = zlib.compress(text.encode("utf-8"), 9)[2:-4]
+    result = ""
+    for char in base64.b64encode(compressed).decode("ascii"):
+        if char != "=":
+            result += plantuml_alphabet[standard_alphabet.index(char)]
+    return result
+
+
+def make_source(size: int, seed: int = 0) -> str:
+    """A sequence diagram with enough variety that it does not compress trivially."""
+    rng = random.Random(seed)
+    names = [f"Service{n}" for n in range(40)]
+    lines = ["@startuml"]
+    length = len(lines[0])
+    while length < size:
+        line = (
+            f"{rng.choice(names)} -> {rng.choice(names)}: "
+            f"call_{rng.randrange(10_000)}({rng.random():.4f})"
+        )
+        lines.append(line)
+        length += len(line) + 1
+    lines.append("@enduml")
+    return "\n".join(lines)
+
+
+def throughput(fn, text: str, min_seconds: float = 0.5) -> float:
+    """Return MB/s of source text processed by ``fn``."""
+    runs = 0
+    start = time.perf_counter()
+    while True:
+        fn(text)
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return len(text.encode("utf-8")) * runs / elapsed / 1e6
+
+
+def main() -> None:
+    encoders = {
+        "encode": encode,
+        "legacy PlantUML.encode": legacy_plantuml_encode,
+        "legacy plantuml_encode": legacy_state_encode,
+    }
+    print(f"{'size':>8}  {'encoder':<24} {'MB/s':>9}")
+    for label, size in SIZES.items():
+        text = make_source(size)
+        assert decode(encode(text)) == text
+        for name, fn in encoders.items():
+            print(f"{label:>8}  {name:<24} {throughput(fn, text):>9.2f}")
+        encoded = encode(text)
+        print(f"{label:>8}  {'decode':<24} {throughput(lambda _: decode(encoded), text):>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
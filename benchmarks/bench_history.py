@@ -0,0 +1,121 @@
+"""Benchmark for the per-document version history.
+
+Types a few thousand single-character edits (with the odd newline, delete
+and undo) into 1 KB and 100 KB documents through the document store, then
+reports the writer's cost per revision, bytes on disk per revision, and the
+time to list versions and to rebuild random ones. Rebuilt texts are checked
+against the texts that were typed.
+
+    poetry run python benchmarks/bench_history.py [--revisions 5000]
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from bench_encoder import make_source  # noqa: E402
+
+from codoc_in_plantuml.utils.document_store import DocumentStore  # noqa: E402
+from codoc_in_plantuml.utils.text_ops import TextOperation  # noqa: E402
+
+SIZES = {"1 KB": 1024, "100 KB": 100 * 1024}
+SAMPLES = 200
+
+
+def edits(code: str, revisions: int, seed: int = 0):
+    """Yield ``(operation, new_code)`` for a simulated typing session."""
+    rng = random.Random(seed)
+    cursor = len(code) // 2
+    last = None
+    for _ in range(revisions):
+        roll = rng.random()
+        if roll < 0.02 and last is not None:
+            # Undo the previous edit, which brings back an earlier text.
+            kind, at, char = last
+            kind = "delete" if kind == "insert" else "insert"
+        elif roll < 0.1 and cursor > 0:
+            kind, at, char = "delete", cursor - 1, code[cursor - 1]
+        else:
+            kind, at = "insert", cursor
+            char = "\n" if roll > 0.97 else rng.choice("abcdefghij ->:")
+        operation = TextOperation().retain(at)
+        if kind == "insert":
+            operation.insert(char).retain(len(code) - at)
+            code = code[:at] + char + code[at:]
+            cursor = at + 1
+        else:
+            operation.delete(1).retain(len(code) - at - 1)
+            code = code[:at] + code[at + 1 :]
+            cursor = at
+        last = (kind, at, char)
+        if rng.random() < 0.01:
+            cursor = rng.randrange(len(code) + 1)
+        yield operation, code
+
+
+def run(size: int, revisions: int, max_deltas: int) -> dict[str, float]:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "documents.sqlite3"
+        store = DocumentStore(path, snapshot_every=100, history_deltas=max_deltas)
+        rng = random.Random(1)
+        sampled = set(rng.sample(range(1, revisions + 1), min(SAMPLES, revisions)))
+        expected = {}
+        start = time.perf_counter()
+        for version, (operation, code) in enumerate(
+            edits(make_source(size), revisions), start=1
+        ):
+            store.append_edit("room", version, operation.to_json(), code)
+            if version % store.snapshot_every == 0:
+                store.save_snapshot("room", version, code)
+            if version in sampled:
+                expected[version] = code
+        store.flush()
+        write_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        store.versions("room", limit=1000)
+        list_ms = (time.perf_counter() - start) * 1000
+
+        latencies = []
+        mismatches = 0
+        for version, code in expected.items():
+            start = time.perf_counter()
+            text = store.load_version("room", version)
+            latencies.append((time.perf_counter() - start) * 1000)
+            mismatches += text != code
+        store.close()
+        disk = sum(p.stat().st_size for p in Path(tmp).iterdir())
+    return {
+        "us/rev": write_seconds / revisions * 1e6,
+        "B/rev": disk / revisions,
+        "list ms": list_ms,
+        "load p50 ms": statistics.median(latencies),
+        "load max ms": max(latencies),
+        "mismatches": mismatches,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--revisions", type=int, default=5000)
+    parser.add_argument("--max-deltas", type=int, default=128)
+    args = parser.parse_args()
+    columns = ["us/rev", "B/rev", "list ms", "load p50 ms", "load max ms", "mismatches"]
+    print(f"{'size':>8}  " + "  ".join(f"{c:>11}" for c in columns))
+    for label, size in SIZES.items():
+        result = run(size, args.revisions, args.max_deltas)
+        print(
+            f"{label:>8}  "
+            + "  ".join(f"{result[c]:>11.2f}" for c in columns[:-1])
+            + f"  {result['mismatches']:>11d}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""JVM startup benchmark for local (jar) rendering.
+
+Times a cold one-shot ``java -jar plantuml.jar`` render under a few JVM
+configurations, and a render on an already running daemon for comparison.
+Needs Java and downloads the PlantUML jar on first use.
+
+    poetry run python benchmarks/bench_jvm_startup.py [--runs 5]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from codoc_in_plantuml.utils.jvm import ensure_cds_archive  # noqa: E402
+from codoc_in_plantuml.utils.plantuml import PlantUML  # noqa: E402
+from codoc_in_plantuml.utils.render_daemon import PlantUMLWorker  # noqa: E402
+
+SOURCE = "@startuml\nAlice -> Bob: hello\nBob --> Alice: ok\n@enduml"
+
+# Environment for each one-shot configuration. Unset keys fall back to the
+# app defaults, so "tuned" is what a fresh checkout runs with.
+CONFIGS = {
+    "JVM defaults": {"CODOC_PLANTUML_JVM_GC": "", "CODOC_PLANTUML_JVM_MAX_HEAP": ""},
+    "tuned flags": {},
+    "tuned + AppCDS": {"CODOC_PLANTUML_APPCDS": "1"},
+    "tuned + AppCDS + C1 only": {
+        "CODOC_PLANTUML_APPCDS": "1",
+        "CODOC_PLANTUML_JVM_OPTS": "-XX:TieredStopAtLevel=1",
+    },
+}
+CONFIG_KEYS = {key for env in CONFIGS.values() for key in env}
+
+
+def timed(fn, runs: int) -> list[float]:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def report(name: str, samples: list[float]) -> None:
+    print(
+        f"{name:<26} {statistics.median(samples) * 1000:>9.0f} "
+        f"{min(samples) * 1000:>9.0f} {max(samples) * 1000:>9.0f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    jar_path = PlantUML._ensure_jar()
+    saved = {key: os.environ.get(key) for key in CONFIG_KEYS}
+    # Build the archive up front so training is not counted as a render.
+    if ensure_cds_archive(jar_path) is None:
+        print("AppCDS archive unavailable (needs JDK 13+); CDS rows fall back.\n")
+
+    print(f"{'configuration':<26} {'median ms':>9} {'min ms':>9} {'max ms':>9}")
+    try:
+        for name, env in CONFIGS.items():
+            for key in CONFIG_KEYS:
+                os.environ.pop(key, None)
+            os.environ.update(env)
+            report(name, timed(lambda: PlantUML._render_with_jar(SOURCE), args.runs))
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+    worker = PlantUMLWorker(jar_path, "svg")
+    worker.start()
+    try:
+        worker.render(SOURCE, timeout=60)
+        report("warm daemon", timed(lambda: worker.render(SOURCE, timeout=60), args.runs))
+    finally:
+        worker.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""Benchmark suite over the built-in snippet corpus.
+
+Measures encoder throughput, render latency per diagram type (p50/p95/p99),
+render cache effectiveness and the size of the ``diagram_urls`` state delta,
+writes the results as JSON and compares them against a baseline recorded on
+the same machine (none is committed; the first run should record one).
+Runs offline against the local jar; it never downloads one.
+
+    poetry run python benchmarks/bench_suite.py
+    poetry run python benchmarks/bench_suite.py --update-baseline
+"""
+
+import argparse
+import base64
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+
+# Local rendering only, with a memory-only cache so runs do not share state.
+os.environ["CODOC_PLANTUML_USE_JAR"] = "1"
+os.environ["CODOC_PLANTUML_DISK_CACHE"] = "0"
+os.environ.pop("CODOC_PLANTUML_PROXY", None)
+
+from bench_encoder import SIZES, make_source, throughput  # noqa: E402
+
+from codoc_in_plantuml.states.editor_state import snippets_by_category  # noqa: E402
+from codoc_in_plantuml.utils.blocks import block_format, split_blocks  # noqa: E402
+from codoc_in_plantuml.utils.encoding import decode, encode  # noqa: E402
+from codoc_in_plantuml.utils.plantuml import PlantUML  # noqa: E402
+
+DEFAULT_OUTPUT = BENCH_DIR / "results" / "latest.json"
+DEFAULT_BASELINE = BENCH_DIR / "baseline.json"
+# Metric name suffixes where a larger value is an improvement.
+HIGHER_IS_BETTER = ("_mbps", "_ratio")
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    """p50/p95/p99 of ``samples`` (seconds), reported in milliseconds."""
+    if len(samples) == 1:
+        return {f"p{p}_ms": samples[0] * 1000 for p in (50, 95, 99)}
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {f"p{p}_ms": cuts[p - 1] * 1000 for p in (50, 95, 99)}
+
+
+def corpus_blocks() -> dict[str, list[str]]:
+    return {
+        category: [block for code in codes for block in split_blocks(code)]
+        for category, codes in snippets_by_category().items()
+    }
+
+
+def bench_encoder(corpus: dict[str, list[str]]) -> dict[str, float]:
+    results = {}
+    for label, size in SIZES.items():
+        text = make_source(size)
+        encoded = encode(text)
+        name = label.replace(" ", "")
+        results[f"encoder.{name}.encode_mbps"] = throughput(encode, text)
+        results[f"encoder.{name}.decode_mbps"] = throughput(
+            lambda _: decode(encoded), text
+        )
+    blocks = [block for category in corpus.values() for block in category]
+    start = time.perf_counter()
+    for block in blocks:
+        encode(block)
+    results["encoder.corpus.encode_ms"] = (time.perf_counter() - start) * 1000
+    return results
+
+
+def bench_render(
+    corpus: dict[str, list[str]], repeat: int
+) -> tuple[dict[str, float], dict[str, str]]:
+    """Uncached render latency per diagram type.
+
+    The first render of each output format is timed on its own as the cold
+    start (the JVM launch for the daemon). Blocks that fail to render are
+    reported, not timed.
+    """
+    results: dict[str, float] = {}
+    failures: dict[str, str] = {}
+    firsts = {}
+    for block in (block for blocks in corpus.values() for block in blocks):
+        firsts.setdefault(block_format(block), block)
+    for format, block in firsts.items():
+        start = time.perf_counter()
+        PlantUML._render_uncached(PlantUML._cache_key(block, format), block, format)
+        results[f"render.cold_start.{format}_ms"] = (time.perf_counter() - start) * 1000
+
+    all_samples = []
+    for category, blocks in corpus.items():
+        samples = []
+        for block in blocks:
+            format = block_format(block)
+            key = PlantUML._cache_key(block, format)
+            for _ in range(repeat):
+                start = time.perf_counter()
+                try:
+                    PlantUML._render_uncached(key, block, format)
+                except (RuntimeError, OSError) as e:
+                    failures[category] = str(e).strip().splitlines()[0]
+                    break
+                samples.append(time.perf_counter() - start)
+        if samples:
+            for name, value in percentiles(samples).items():
+                results[f"render.{category}.{name}"] = value
+        all_samples.extend(samples)
+    for name, value in percentiles(all_samples).items():
+        results[f"render.all.{name}"] = value
+    return results, failures
+
+
+def bench_cache(corpus: dict[str, list[str]]) -> dict[str, float]:
+    """Cold pass then warm pass over the corpus through the cached path."""
+    cache = PlantUML.render_cache()
+    cache.clear()
+    blocks = [block for category in corpus.values() for block in category]
+    passes = {}
+    for name in ("miss", "hit"):
+        before = cache.stats()
+        samples = []
+        for block in blocks:
+            start = time.perf_counter()
+            try:
+                PlantUML.render(block, block_format(block))
+            except (RuntimeError, OSError):
+                continue
+            samples.append(time.perf_counter() - start)
+        after = cache.stats()
+        hits = after["hits"] - before["hits"]
+        lookups = hits + after["misses"] - before["misses"]
+        passes[name] = (samples, hits / max(lookups, 1))
+    stats = cache.stats()
+    return {
+        "cache.miss.p50_ms": percentiles(passes["miss"][0])["p50_ms"],
+        "cache.hit.p50_ms": percentiles(passes["hit"][0])["p50_ms"],
+        "cache.warm_hit_ratio": passes["hit"][1],
+        "cache.entries": stats["entries"],
+        "cache.bytes": stats["bytes"],
+    }
+
+
+def _data_url(content: bytes, format: str) -> str:
+    """The inline image URL the app sent before it served ``/render`` URLs."""
+    mime = "image/svg+xml" if format == "svg" else f"image/{format}"
+    return f"data:{mime};base64,{base64.b64encode(content).decode('ascii')}"
+
+
+def bench_deltas(corpus: dict[str, list[str]]) -> dict[str, float]:
+    """JSON size of the ``diagram_urls`` delta sent to clients per snippet.
+
+    Compares the ``/render`` URLs the app sends in jar mode with inline data
+    URLs and with PlantUML server URLs.
+    """
+    sizes: dict[str, list[int]] = {"render_url": [], "data_url": [], "server_url": []}
+    for codes in snippets_by_category().values():
+        for code in codes:
+            blocks = split_blocks(code)
+            urls: dict[str, list[str]] = {name: [] for name in sizes}
+            for block in blocks:
+                format = block_format(block)
+                key = PlantUML._cache_key(block, format)
+                content = PlantUML.render_cache().get(key)
+                if content is None:
+                    break
+                urls["render_url"].append(PlantUML._render_url(key, format))
+                urls["data_url"].append(_data_url(content, format))
+                urls["server_url"].append(PlantUML.get_url(block, format))
+            else:
+                for name, values in urls.items():
+                    sizes[name].append(len(json.dumps({"diagram_urls": values})))
+    results = {}
+    for name, values in sizes.items():
+        if values:
+            results[f"delta.{name}.mean_bytes"] = statistics.fmean(values)
+            results[f"delta.{name}.max_bytes"] = max(values)
+    return results
+
+
+def compare(
+    metrics: dict[str, float],
+    baseline: dict[str, float],
+    threshold: float,
+    min_delta_ms: float,
+) -> list[str]:
+    """Print a comparison table and return the names of regressed metrics."""
+    regressions = []
+    print(f"\n{'metric':<44} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, value in metrics.items():
+        old = baseline.get(name)
+        if old is None:
+            print(f"{name:<44} {'-':>12} {value:>12.3f}")
+            continue
+        change = (value - old) / old if old else 0.0
+        worse = -change if name.endswith(HIGHER_IS_BETTER) else change
+        # Cache sizes and delta sizes are descriptive; only time, throughput
+        # and ratios are held to the threshold.
+        gated = name.endswith(("_ms", "_mbps", "_ratio"))
+        if name.endswith("_ms") and abs(value - old) < min_delta_ms:
+            gated = False
+        flag = ""
+        if gated and worse > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<44} {old:>12.3f} {value:>12.3f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--renderer", choices=("daemon", "jar"), default="daemon")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="relative slowdown that counts as a regression (default 0.2)",
+    )
+    parser.add_argument(
+        "--min-delta-ms",
+        type=float,
+        default=1.0,
+        help="ignore latency changes smaller than this, in ms (default 1.0)",
+    )
+    args = parser.parse_args()
+
+    jar_path = PlantUML._default_jar_path()
+    if not jar_path.exists():
+        print(
+            f"PlantUML jar not found at {jar_path}. Run the app once in jar mode "
+            "or set CODOC_PLANTUML_JAR_PATH; the suite does not download it.",
+            file=sys.stderr,
+        )
+        return 2
+    os.environ["CODOC_PLANTUML_DAEMON"] = "1" if args.renderer == "daemon" else "0"
+
+    corpus = corpus_blocks()
+    metrics: dict[str, float] = {}
+    print("encoder ...", flush=True)
+    metrics.update(bench_encoder(corpus))
+    print("render ...", flush=True)
+    render_metrics, failures = bench_render(corpus, args.repeat)
+    metrics.update(render_metrics)
+    print("cache ...", flush=True)
+    metrics.update(bench_cache(corpus))
+    print("state deltas ...", flush=True)
+    metrics.update(bench_deltas(corpus))
+
+    result = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "renderer": args.renderer,
+            "renderer_version": PlantUML._renderer_version(),
+            "repeat": args.repeat,
+            "blocks": sum(len(blocks) for blocks in corpus.values()),
+        },
+        "failures": failures,
+        "metrics": metrics,
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(result, indent=2) + "\n")
+    print(f"wrote {args.output}")
+    for category, error in failures.items():
+        print(f"render failed for {category}: {error}")
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(result, indent=2) + "\n")
+        print(f"updated baseline {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print(
+            f"no baseline at {args.baseline}, so nothing was compared; baselines "
+            "are per machine, record one with --update-baseline"
+        )
+        return 0
+    baseline = json.loads(args.baseline.read_text())
+    regressions = compare(
+        metrics, baseline["metrics"], args.threshold, args.min_delta_ms
+    )
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""Local stand-in for a PlantUML server, for load tests without network.
+
+Answers ``GET /{format}/{encoded}`` and ``POST /{format}`` like a PlantUML
+server, after a configurable delay, with a small SVG (or PNG header) that
+identifies the source. Sources are decoded, so bad encodings fail loudly.
+
+    poetry run python benchmarks/fake_plantuml_server.py --port 8081
+    export CODOC_PLANTUML_SERVER=http://127.0.0.1:8081/plantuml
+"""
+
+import argparse
+import hashlib
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from codoc_in_plantuml.utils.encoding import decode  # noqa: E402
+
+PREFIX = "/plantuml"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "FakePlantUMLServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _parse(self) -> tuple[str, str] | None:
+        path = self.path.split("?", 1)[0]
+        if not path.startswith(PREFIX + "/"):
+            return None
+        format, _, encoded = path[len(PREFIX) + 1 :].partition("/")
+        return format, encoded
+
+    def do_GET(self):
+        parsed = self._parse()
+        if parsed is None or not parsed[1]:
+            self._send(404, b"not found", "text/plain")
+            return
+        format, encoded = parsed
+        try:
+            source = decode(encoded)
+        except Exception:
+            self._send(400, b"bad encoding", "text/plain")
+            return
+        self._render(format, source)
+
+    def do_POST(self):
+        parsed = self._parse()
+        length = int(self.headers.get("Content-Length", "0"))
+        source = self.rfile.read(length).decode("utf-8", errors="replace")
+        if parsed is None:
+            self._send(404, b"not found", "text/plain")
+            return
+        self._render(parsed[0], source)
+
+    def _render(self, format: str, source: str) -> None:
+        self.server.count(len(source))
+        time.sleep(self.server.latency + self.server.latency_per_kb * len(source) / 1024)
+        digest = hashlib.sha1(source.encode("utf-8")).hexdigest()[:12]
+        if format == "png":
+            self._send(200, b"\x89PNG\r\n\x1a\n" + digest.encode(), "image/png")
+            return
+        lines = source.count("\n") + 1
+        body = (
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="200" height="{20 * lines}">'
+            f'<text x="10" y="20">{digest}</text></svg>'
+        ).encode("utf-8")
+        self._send(200, body, "image/svg+xml")
+
+    def _send(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakePlantUMLServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.05,
+        latency_per_kb: float = 0.01,
+    ):
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self.latency_per_kb = latency_per_kb
+        self.renders = 0
+        self.source_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{PREFIX}"
+
+    def count(self, size: int) -> None:
+        with self._lock:
+            self.renders += 1
+            self.source_bytes += size
+
+    def start(self) -> "FakePlantUMLServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds")
+    parser.add_argument(
+        "--latency-per-kb", type=float, default=0.01, help="seconds per KB of source"
+    )
+    args = parser.parse_args()
+    server = FakePlantUMLServer(args.host, args.port, args.latency, args.latency_per_kb)
+    print(f"Fake PlantUML server on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
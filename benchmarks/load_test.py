@@ -0,0 +1,610 @@
+"""Multi-client load test for collaborative rooms.
+
+Opens many simulated browser sessions over Reflex's websocket against
+``/doc/{id}`` rooms, replays typing from the built-in snippets as edit batches sent to
+``DocumentState.apply_edits`` (the same operation protocol as the browser
+editor) and records:
+
+- event round trip: edit batch sent until the typist gets it acknowledged
+- broadcast fan-out: edit batch sent until each other client in the room sees
+  it, and until the last one does
+- preview settle time: last keystroke of a snippet until its diagram arrives
+- bytes received per client, and backend memory (RSS of the process tree)
+
+Renders go to a local fake PlantUML server (``fake_plantuml_server.py``),
+so no network is needed. With ``--start-backend`` the script launches
+``reflex run --backend-only`` wired to the fake server in proxy mode;
+otherwise it targets ``--backend-url`` and prints the settings to use.
+
+    poetry run python benchmarks/load_test.py --start-backend --rooms 2 --clients 50
+
+Needs the socket.io client extras: ``pip install "python-socketio[asyncio_client]"``.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import signal
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+from urllib.request import urlopen
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_ROOT = BENCH_DIR.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+import socketio  # noqa: E402
+from fake_plantuml_server import FakePlantUMLServer  # noqa: E402
+
+from codoc_in_plantuml.states.document_state import DocumentState  # noqa: E402
+from codoc_in_plantuml.states.editor_state import (  # noqa: E402
+    EditorState,
+    snippet_sources,
+)
+from codoc_in_plantuml.utils.text_ops import TextOperation, text_length  # noqa: E402
+
+NAMESPACE = "/_event"
+DOC_STATE = DocumentState.get_full_name()
+ON_LOAD = f"{EditorState.get_full_name()}.on_load"
+APPLY_EDITS = f"{DOC_STATE}.apply_edits"
+SYNC_DOCUMENT = f"{DOC_STATE}.sync_document"
+# Replies to the editor arrive as ``window.codocSync.<method>(<json>)`` scripts.
+SYNC_SCRIPT_RE = re.compile(r"^window\.codocSync\.(\w+)\((.*)\)$", re.DOTALL)
+DEFAULT_OUTPUT = BENCH_DIR / "results" / "load_test.json"
+
+
+BatchKey = tuple[str, int]
+
+
+class Tracker:
+    """Send times of every edit batch, shared by all clients of a run."""
+
+    def __init__(self):
+        self.sent: dict[BatchKey, float] = {}
+        self.round_trip: list[float] = []
+        self.fan_out: list[float] = []
+        # (room, batch) -> latest arrival among the room's other clients.
+        self.fan_out_last: dict[tuple[str, BatchKey], float] = {}
+        self.settle: list[float] = []
+
+
+class SimClient:
+    """One browser tab: a websocket session that joins a room.
+
+    Keeps its own copy of the document and follows the editor's sync
+    protocol (``components/collab_sync.js``): one batch in flight, later
+    edits buffered, remote batches transformed against both.
+    """
+
+    def __init__(self, base_url: str, room: str, tracker: Tracker):
+        self.base_url = base_url
+        self.room = room
+        self.tracker = tracker
+        self.token = str(uuid.uuid4())
+        self.client_id = uuid.uuid4().hex[:10]
+        self.typist = False
+        self.joined = asyncio.Event()
+        self.bytes_received = 0
+        self.diagram_updates = 0
+        self.last_diagram_at = 0.0
+        self.last_ack_at = 0.0
+        self._seen: set[BatchKey] = set()
+        self.version = -1
+        self.text = ""
+        self.cursor = 0
+        self.seq = 0
+        self.outstanding: TextOperation | None = None
+        self.buffer: TextOperation | None = None
+        self.catching_up = False
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.sio.on("event", self._on_event, namespace=NAMESPACE)
+
+    async def connect(self) -> None:
+        await self.sio.connect(
+            f"{self.base_url}?token={self.token}",
+            socketio_path=NAMESPACE,
+            transports=["websocket"],
+            namespaces=[NAMESPACE],
+        )
+        await self.send(ON_LOAD)
+
+    async def send(self, name: str, payload: dict | None = None) -> None:
+        router_data = {
+            "pathname": "/doc/[share_id]",
+            "asPath": f"/doc/{self.room}",
+            "query": {"share_id": self.room},
+        }
+        await self.sio.emit(
+            "event",
+            namespace=NAMESPACE,
+            data={
+                "token": self.token,
+                "name": name,
+                "payload": payload or {},
+                "router_data": router_data,
+            },
+        )
+
+    async def _on_event(self, update: dict) -> None:
+        now = time.perf_counter()
+        self.bytes_received += len(json.dumps(update))
+        for name, value in update.get("delta", {}).get(DOC_STATE, {}).items():
+            if name.startswith("diagram_urls"):
+                self.diagram_updates += 1
+                self.last_diagram_at = now
+            elif name.startswith("last_edit"):
+                await self._receive(value, now)
+        for event in update.get("events", []):
+            if event["name"] == "_call_script":
+                await self._run_script(event["payload"]["javascript_code"], now)
+            elif not event["name"].startswith("_"):
+                # Backend events returned by a handler; the browser chains
+                # them back the same way.
+                await self.send(event["name"], event.get("payload", {}))
+
+    async def _run_script(self, script: str, now: float) -> None:
+        match = SYNC_SCRIPT_RE.match(script)
+        if match is None:
+            return
+        method, argument = match.group(1), json.loads(match.group(2))
+        if method == "load":
+            self.version, self.text = argument["version"], argument["code"]
+            self.cursor = text_length(self.text)
+            self.outstanding = self.buffer = None
+            self.catching_up = False
+            self.joined.set()
+        elif method == "receive":
+            await self._receive(argument, now)
+        elif method == "receiveAll":
+            self.catching_up = False
+            for batch in argument:
+                await self._receive(batch, now)
+
+    async def _receive(self, batch: dict, now: float) -> None:
+        if not batch or self.version < 0 or batch["version"] <= self.version:
+            return
+        if batch["version"] > self.version + 1:
+            if not self.catching_up:
+                self.catching_up = True
+                await self.send(SYNC_DOCUMENT, {"since": self.version})
+            return
+        self.version = batch["version"]
+        key = (batch["client"], batch["seq"])
+        self._record(key, now)
+        if self.outstanding is not None and key == (self.client_id, self.seq):
+            self.last_ack_at = now
+            self.outstanding, self.buffer = self.buffer, None
+            if self.outstanding is not None:
+                await self._send_batch(self.outstanding)
+            return
+        operation = TextOperation.from_json(batch["ops"])
+        if self.outstanding is not None:
+            self.outstanding, operation = TextOperation.transform(
+                self.outstanding, operation
+            )
+        if self.buffer is not None:
+            self.buffer, operation = TextOperation.transform(self.buffer, operation)
+        self.cursor = shift_index(self.cursor, operation)
+        self.text = operation.apply(self.text)
+
+    def _record(self, key: BatchKey, now: float) -> None:
+        sent_at = self.tracker.sent.get(key)
+        if sent_at is None or key in self._seen:
+            return
+        self._seen.add(key)
+        latency = now - sent_at
+        if key[0] == self.client_id:
+            self.tracker.round_trip.append(latency)
+        else:
+            self.tracker.fan_out.append(latency)
+            room_key = (self.room, key)
+            last = self.tracker.fan_out_last.get(room_key, 0.0)
+            self.tracker.fan_out_last[room_key] = max(last, latency)
+
+    async def edit(self, operation: TextOperation, cursor: int) -> None:
+        """Apply a local edit and send it, or buffer it behind the one in flight."""
+        self.text = operation.apply(self.text)
+        self.cursor = cursor
+        if self.buffer is not None:
+            self.buffer = self.buffer.compose(operation)
+        elif self.outstanding is not None:
+            self.buffer = operation
+        else:
+            self.outstanding = operation
+            await self._send_batch(operation)
+
+    async def _send_batch(self, operation: TextOperation) -> None:
+        self.seq += 1
+        self.tracker.sent[(self.client_id, self.seq)] = time.perf_counter()
+        batch = {
+            "version": self.version,
+            "client": self.client_id,
+            "seq": self.seq,
+            "ops": operation.to_json(),
+        }
+        await self.send(APPLY_EDITS, {"batch": batch})
+
+    async def type_char(self, char: str) -> None:
+        length = text_length(self.text)
+        operation = (
+            TextOperation()
+            .retain(self.cursor)
+            .insert(char)
+            .retain(length - self.cursor)
+        )
+        await self.edit(operation, self.cursor + text_length(char))
+
+    async def backspace(self) -> None:
+        length = text_length(self.text)
+        if self.cursor == 0:
+            return
+        operation = (
+            TextOperation()
+            .retain(self.cursor - 1)
+            .delete(1)
+            .retain(length - self.cursor)
+        )
+        await self.edit(operation, self.cursor - 1)
+
+    async def clear(self) -> None:
+        operation = TextOperation().delete(text_length(self.text))
+        if not operation.is_noop():
+            await self.edit(operation, 0)
+
+    async def close(self) -> None:
+        await self.sio.disconnect()
+
+
+def shift_index(index: int, operation: TextOperation) -> int:
+    """Where a cursor at ``index`` ends up after a remote ``operation``."""
+    position, shifted = 0, index
+    for op in operation.ops:
+        if position >= index:
+            break
+        if isinstance(op, str):
+            shifted += text_length(op)
+        elif op > 0:
+            position += op
+        else:
+            deleted = min(-op, index - position)
+            shifted -= deleted
+            position += -op
+    return shifted
+
+
+def keystrokes_for(text: str, rng: random.Random, typo_rate: float):
+    """Keys pressed while typing ``text``: characters, and None for backspace."""
+    for char in text:
+        if char.isalpha() and rng.random() < typo_rate:
+            yield rng.choice("asdfjkl")
+            yield None
+        yield char
+
+
+async def type_into(
+    client: SimClient,
+    sources: list[str],
+    keystrokes: int,
+    cps: float,
+    rng: random.Random,
+    args: argparse.Namespace,
+) -> int:
+    """Replay snippets keystroke by keystroke into an emptied document.
+
+    Returns the number of keystrokes sent.
+    """
+    sent = 0
+    tracker = client.tracker
+    while sent < keystrokes:
+        source = rng.choice(sources)
+        await client.clear()
+        for key in keystrokes_for(source, rng, args.typo_rate):
+            last_key_at = time.perf_counter()
+            if key is None:
+                await client.backspace()
+            else:
+                await client.type_char(key)
+            sent += 1
+            if sent >= keystrokes:
+                break
+            await asyncio.sleep(rng.uniform(0.5, 1.5) / cps)
+        else:
+            # A finished snippet renders; a cut-off one may never do so.
+            settled_at = await wait_for_preview(client)
+            if settled_at is not None:
+                tracker.settle.append(settled_at - last_key_at)
+        await asyncio.sleep(args.pause)
+    return sent
+
+
+async def wait_for_preview(client: SimClient, timeout: float = 15.0) -> float | None:
+    """Arrival time of the first diagram after every local edit was applied."""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if client.outstanding is None and (
+            client.last_diagram_at > client.last_ack_at
+        ):
+            return client.last_diagram_at
+        await asyncio.sleep(0.01)
+    return None
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    if not samples:
+        return {}
+    if len(samples) == 1:
+        return {f"p{p}_ms": samples[0] * 1000 for p in (50, 95, 99)}
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {f"p{p}_ms": cuts[p - 1] * 1000 for p in (50, 95, 99)}
+
+
+def process_tree_rss(pid: int) -> int:
+    """Resident memory of ``pid`` and its descendants in bytes (Linux /proc)."""
+    children: dict[int, list[int]] = {}
+    for stat in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            fields = stat.read_text().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(stat.parent.name))
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, []))
+        try:
+            for line in Path(f"/proc/{current}/status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1]) * 1024
+        except OSError:
+            continue
+    return total
+
+
+async def sample_memory(pid: int, samples: list[int], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        samples.append(process_tree_rss(pid))
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=1.0)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_backend(port: int, plantuml_url: str, log_path: Path) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "CODOC_PLANTUML_USE_JAR": "0",
+        "CODOC_PLANTUML_PROXY": "1",
+        "CODOC_PLANTUML_SERVER": plantuml_url,
+    }
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with log_path.open("wb") as log:
+        process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "reflex",
+                "run",
+                "--backend-only",
+                "--backend-port",
+                str(port),
+            ],
+            cwd=REPO_ROOT,
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+    deadline = time.monotonic() + 180
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Backend exited early; see {log_path}")
+        try:
+            with urlopen(f"http://127.0.0.1:{port}/ping", timeout=1):
+                return process
+        except OSError:
+            time.sleep(1)
+    stop_backend(process)
+    raise RuntimeError(f"Backend did not start; see {log_path}")
+
+
+def stop_backend(process: subprocess.Popen) -> None:
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=15)
+    except ProcessLookupError:
+        return
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+def scrape_metrics(base_url: str) -> dict[str, float]:
+    """Counters and gauges from the backend's /metrics (histogram sums too)."""
+    try:
+        with urlopen(f"{base_url}/metrics", timeout=5) as response:
+            text = response.read().decode("utf-8")
+    except OSError:
+        return {}
+    metrics = {}
+    for line in text.splitlines():
+        if line.startswith("#") or "_bucket" in line:
+            continue
+        name, _, value = line.rpartition(" ")
+        metrics[name] = float(value)
+    return metrics
+
+
+async def run(args: argparse.Namespace, base_url: str) -> dict:
+    rng = random.Random(args.seed)
+    tracker = Tracker()
+    sources = snippet_sources()
+    rooms = [f"load-{uuid.uuid4().hex[:8]}" for _ in range(args.rooms)]
+    clients = [
+        SimClient(base_url, room, tracker)
+        for room in rooms
+        for _ in range(args.clients)
+    ]
+    connecting = asyncio.Semaphore(args.connect_concurrency)
+
+    async def join(client: SimClient) -> None:
+        async with connecting:
+            await client.connect()
+            await asyncio.wait_for(client.joined.wait(), timeout=60)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(join(client) for client in clients))
+    join_seconds = time.perf_counter() - start
+    print(f"{len(clients)} clients joined {len(rooms)} room(s) in {join_seconds:.1f}s")
+
+    typists = []
+    for index, room in enumerate(rooms):
+        room_clients = clients[index * args.clients : (index + 1) * args.clients]
+        for client in room_clients[: args.typists]:
+            client.typist = True
+            typists.append(client)
+    start = time.perf_counter()
+    sent = await asyncio.gather(
+        *(
+            type_into(
+                client,
+                sources,
+                args.keystrokes,
+                args.cps,
+                random.Random(rng.random()),
+                args,
+            )
+            for client in typists
+        )
+    )
+    typing_seconds = time.perf_counter() - start
+    # Let the last batches reach everyone, then check every copy of each
+    # room's document ended up identical.
+    await asyncio.sleep(2.0)
+    diverged_rooms = sum(
+        len({client.text for client in clients if client.room == room}) > 1
+        for room in rooms
+    )
+    await asyncio.gather(*(client.close() for client in clients))
+
+    received = [client.bytes_received for client in clients]
+    return {
+        "join_seconds": join_seconds,
+        "typing_seconds": typing_seconds,
+        "keystrokes": sum(sent),
+        "round_trip": percentiles(tracker.round_trip),
+        "fan_out": percentiles(tracker.fan_out),
+        "fan_out_complete": percentiles(list(tracker.fan_out_last.values())),
+        "preview_settle": percentiles(tracker.settle),
+        "diverged_rooms": diverged_rooms,
+        "bytes_received_per_client": {
+            "mean": statistics.fmean(received),
+            "max": max(received),
+        },
+        "diagram_updates_per_client": statistics.fmean(
+            client.diagram_updates for client in clients
+        ),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend-url", default="http://127.0.0.1:8000")
+    parser.add_argument(
+        "--start-backend",
+        action="store_true",
+        help="launch `reflex run --backend-only` wired to the fake PlantUML server",
+    )
+    parser.add_argument("--backend-pid", type=int, help="sample RSS of this process")
+    parser.add_argument("--rooms", type=int, default=1)
+    parser.add_argument("--clients", type=int, default=50, help="clients per room")
+    parser.add_argument("--typists", type=int, default=1, help="typists per room")
+    parser.add_argument("--keystrokes", type=int, default=300, help="per typist")
+    parser.add_argument("--cps", type=float, default=8.0, help="keystrokes/second")
+    parser.add_argument("--typo-rate", type=float, default=0.03)
+    parser.add_argument("--pause", type=float, default=2.0, help="seconds")
+    parser.add_argument("--connect-concurrency", type=int, default=20)
+    parser.add_argument("--plantuml-latency", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    args = parser.parse_args()
+
+    fake = FakePlantUMLServer(latency=args.plantuml_latency).start()
+    base_url = args.backend_url.rstrip("/")
+    backend = None
+    pid = args.backend_pid
+    if args.start_backend:
+        port = int(base_url.rsplit(":", 1)[1])
+        print(f"starting backend on port {port} ...", flush=True)
+        backend = start_backend(port, fake.url, args.output.with_suffix(".backend.log"))
+        pid = backend.pid
+    else:
+        print(
+            "Using a running backend. For offline renders start it with\n"
+            f"  CODOC_PLANTUML_PROXY=1 CODOC_PLANTUML_SERVER={fake.url}\n"
+            "(the fake server lives only as long as this script)."
+        )
+
+    memory: list[int] = []
+
+    async def measured() -> dict:
+        stop = asyncio.Event()
+        sampler = (
+            asyncio.create_task(sample_memory(pid, memory, stop)) if pid else None
+        )
+        try:
+            return await run(args, base_url)
+        finally:
+            stop.set()
+            if sampler is not None:
+                await sampler
+
+    try:
+        result = asyncio.run(measured())
+        result["server_metrics"] = scrape_metrics(base_url)
+    finally:
+        if backend is not None:
+            stop_backend(backend)
+        fake.shutdown()
+
+    result["config"] = {
+        key: value for key, value in vars(args).items() if key != "output"
+    }
+    result["fake_plantuml"] = {
+        "renders": fake.renders,
+        "source_bytes": fake.source_bytes,
+    }
+    if memory:
+        result["backend_rss_bytes"] = {"start": memory[0], "peak": max(memory)}
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(result, indent=2, default=str) + "\n")
+
+    print(f"\n{'metric':<26} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name in ("round_trip", "fan_out", "fan_out_complete", "preview_settle"):
+        values = result[name]
+        if values:
+            print(
+                f"{name:<26} {values['p50_ms']:>9.1f} {values['p95_ms']:>9.1f} "
+                f"{values['p99_ms']:>9.1f}"
+            )
+    print(f"keystrokes sent: {result['keystrokes']}")
+    print(f"rooms with diverged documents: {result['diverged_rooms']}")
+    print(
+        "bytes received per client: "
+        f"{result['bytes_received_per_client']['mean']:.0f} mean"
+    )
+    print(f"fake PlantUML renders: {fake.renders}")
+    if memory:
+        start_mb, peak_mb = memory[0] / 2**20, max(memory) / 2**20
+        print(f"backend RSS: {start_mb:.0f} MB -> peak {peak_mb:.0f} MB")
+    print(f"wrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
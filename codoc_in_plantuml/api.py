@@ -0,0 +1,140 @@
+import asyncio
+import json
+import re
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from codoc_in_plantuml.states.document_state import has_session, publish_presence
+from codoc_in_plantuml.utils.document_store import get_document_store
+from codoc_in_plantuml.utils.metrics import registry
+from codoc_in_plantuml.utils.plantuml import PlantUML
+from codoc_in_plantuml.utils.presence import PRESENCE_ROUTE, presence
+
+_KEY_RE = re.compile(r"[0-9a-f]{64}")
+_ROOM_RE = re.compile(r"[A-Za-z0-9-]{1,64}")
+_MEDIA_TYPES = {
+    "svg": "image/svg+xml",
+    "png": "image/png",
+    "txt": "text/plain; charset=utf-8",
+}
+
+_responses = registry.counter(
+    "codoc_plantuml_render_responses_total",
+    "Responses from the render endpoint, by status code.",
+    ("status",),
+)
+_bytes_served = registry.counter(
+    "codoc_plantuml_served_bytes_total",
+    "Rendered image bytes sent by the render endpoint.",
+    ("format",),
+)
+
+
+async def serve_render(request: Request) -> Response:
+    """Serve rendered diagram bytes from the render cache by content hash."""
+    key = request.path_params["key"]
+    format = request.path_params["format"]
+    if not _KEY_RE.fullmatch(key) or format not in _MEDIA_TYPES:
+        _responses.inc(status="404")
+        return Response(status_code=404)
+    # The key is a hash of the source, format and renderer, so a given URL
+    # always maps to the same bytes and can be cached forever.
+    headers = {
+        "ETag": f'"{key}"',
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if headers["ETag"] in (tag.strip() for tag in if_none_match.split(",")):
+        _responses.inc(status="304")
+        return Response(status_code=304, headers=headers)
+    cache = PlantUML.render_cache()
+    content = cache.get(key)
+    if content is None:
+        # Evicted, but still shown in some room: render it again.
+        source = cache.source(key)
+        if source is None or source[1] != format:
+            _responses.inc(status="404")
+            return Response(status_code=404)
+        try:
+            content = await PlantUML.render_async(*source)
+        except (RuntimeError, OSError):
+            _responses.inc(status="503")
+            return Response(status_code=503)
+    _responses.inc(status="200")
+    _bytes_served.inc(len(content), format=format)
+    return Response(content, media_type=_MEDIA_TYPES[format], headers=headers)
+
+
+async def serve_presence(request: Request) -> Response:
+    """Heartbeat or leave for a tab that joined a room in ``on_load``."""
+    try:
+        body = json.loads(await request.body())
+        room, token = body["room"], body["token"]
+    except (ValueError, KeyError, TypeError):
+        return Response(status_code=400)
+    if not isinstance(room, str) or not isinstance(token, str):
+        return Response(status_code=400)
+    if not _ROOM_RE.fullmatch(room):
+        return Response(status_code=400)
+    if body.get("leave"):
+        if presence.leave(room, token):
+            publish_presence(room)
+    elif not presence.beat(room, token) and await has_session(token):
+        # A tab that expired, was restored from the back/forward cache or
+        # woke from sleep after leaving: it is still open, so rejoin it.
+        # Tokens without a session are made up; publishing them would create
+        # a state tree for each.
+        for changed in presence.join(room, token):
+            publish_presence(changed)
+    return Response(status_code=204)
+
+
+async def serve_history(request: Request) -> Response:
+    """A room's revisions, newest first; ``before`` pages back from a version."""
+    room = request.path_params["room"]
+    store = get_document_store()
+    if store is None or not _ROOM_RE.fullmatch(room):
+        return Response(status_code=404)
+    try:
+        limit = min(max(int(request.query_params.get("limit", 100)), 1), 1000)
+        before = request.query_params.get("before")
+        before = int(before) if before is not None else None
+    except ValueError:
+        return Response(status_code=400)
+    versions = await asyncio.to_thread(store.versions, room, limit, before)
+    return JSONResponse(versions)
+
+
+async def serve_version(request: Request) -> Response:
+    """The text of a room at one revision."""
+    room = request.path_params["room"]
+    store = get_document_store()
+    if store is None or not _ROOM_RE.fullmatch(room):
+        return Response(status_code=404)
+    code = await asyncio.to_thread(
+        store.load_version, room, request.path_params["version"]
+    )
+    if code is None:
+        return Response(status_code=404)
+    return Response(code, media_type=_MEDIA_TYPES["txt"])
+
+
+async def serve_metrics(request: Request) -> Response:
+    """Render pipeline metrics in the Prometheus text exposition format."""
+    return Response(
+        registry.exposition(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+render_api = Starlette(
+    routes=[
+        Route(f"{PlantUML.RENDER_ROUTE}/{{key}}.{{format}}", serve_render),
+        Route(PRESENCE_ROUTE, serve_presence, methods=["POST"]),
+        Route("/history/{room}", serve_history),
+        Route("/history/{room}/{version:int}", serve_version),
+        Route("/metrics", serve_metrics),
+    ]
+)
@@ -1,10 +1,21 @@
+import asyncio
+import contextlib
+import logging
+import os
 import reflex as rx
+from codoc_in_plantuml.api import render_api
 from codoc_in_plantuml.components.navbar import navbar
 from codoc_in_plantuml.components.editor_pane import editor_pane
 from codoc_in_plantuml.components.preview_pane import preview_pane
 from codoc_in_plantuml.components.help_sidebar import help_sidebar
 from codoc_in_plantuml.components.visual_editor import visual_editor
-from codoc_in_plantuml.states.editor_state import EditorState
+from codoc_in_plantuml.states.document_state import evict_rooms, publish_presence
+from codoc_in_plantuml.states.editor_state import EditorState, snippet_sources
+from codoc_in_plantuml.utils.diagram_types import classify
+from codoc_in_plantuml.utils.document_store import get_document_store
+from codoc_in_plantuml.utils.plantuml import PlantUML
+from codoc_in_plantuml.utils.presence import HEARTBEAT_SECONDS, presence
+from codoc_in_plantuml.utils.rooms import room_budget, room_ttl
 
 
 def index() -> rx.Component:
@@ -95,11 +106,75 @@ def index() -> rx.Component:
     )
 
 
+async def warm_snippet_renders():
+    """Pre-render every example snippet so clicking one is a cache hit."""
+    if not PlantUML._use_jar() or os.getenv(
+        "CODOC_PLANTUML_WARM_SNIPPETS", ""
+    ).lower() not in {"1", "true", "yes"}:
+        return
+    sources = snippet_sources()
+    png = [code for code in sources if classify(code).format == "png"]
+    svg = [code for code in sources if classify(code).format == "svg"]
+    try:
+        await asyncio.to_thread(PlantUML.render_many, svg, "svg")
+        await asyncio.to_thread(PlantUML.render_many, png, "png")
+    except (RuntimeError, OSError) as e:
+        logging.warning(f"Could not warm snippet renders: {e}")
+
+
+async def _sweep_rooms():
+    while True:
+        await asyncio.sleep(min(60.0, room_ttl() / 2))
+        try:
+            evicted = await evict_rooms(room_ttl(), room_budget())
+        except (RuntimeError, OSError) as e:
+            logging.warning(f"Room eviction failed: {e}")
+            continue
+        if evicted:
+            logging.info(f"Evicted {evicted} rooms")
+
+
+async def _expire_presence():
+    while True:
+        await asyncio.sleep(HEARTBEAT_SECONDS)
+        for room in presence.expire():
+            publish_presence(room)
+
+
+@contextlib.asynccontextmanager
+async def maintain_rooms():
+    """Evict idle rooms, keep rooms within the memory budget and drop
+    collaborators whose heartbeats stopped."""
+    tasks = [
+        asyncio.create_task(_sweep_rooms()),
+        asyncio.create_task(_expire_presence()),
+    ]
+    yield
+    for task in tasks:
+        task.cancel()
+    for task in tasks:
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+
+@contextlib.asynccontextmanager
+async def close_document_store():
+    """Commit queued document writes before the backend exits."""
+    yield
+    store = get_document_store()
+    if store is not None:
+        await asyncio.to_thread(store.close)
+
+
 app = rx.App(
     theme=rx.theme(appearance="light"),
     stylesheets=[
         "https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&family=JetBrains+Mono:wght@400;500&display=swap"
     ],
+    api_transformer=render_api,
 )
 app.add_page(index, route="/", on_load=EditorState.on_load)
-app.add_page(index, route="/doc/[share_id]", on_load=EditorState.on_load)
\ No newline at end of file
+app.add_page(index, route="/doc/[share_id]", on_load=EditorState.on_load)
+app.register_lifespan_task(warm_snippet_renders)
+app.register_lifespan_task(maintain_rooms)
+app.register_lifespan_task(close_document_store)
\ No newline at end of file
@@ -0,0 +1,66 @@
+from pathlib import Path
+
+import reflex as rx
+from reflex.constants.compiler import Hooks, Imports
+from reflex.vars.base import VarData
+from reflex_monaco.monaco import MonacoEditor
+from codoc_in_plantuml.states.document_state import DocumentState
+
+# Defines ``window.codocSync``, the browser half of the edit sync, and
+# ``window.codocPresence``, which sends the tab's presence heartbeats.
+_SYNC_JS = (Path(__file__).parent / "collab_sync.js").read_text()
+_PRESENCE_JS = (Path(__file__).parent / "presence.js").read_text()
+
+
+class CollabMonacoEditor(MonacoEditor):
+    """Monaco editor synced with ``DocumentState`` through edit operations.
+
+    The editor is uncontrolled: local changes become operations sent to
+    ``DocumentState.apply_edits`` and remote batches from
+    ``DocumentState.last_edit`` are applied to the model in place, so the
+    document text never travels with a keystroke.
+    """
+
+    @classmethod
+    def create(cls, *children, **props) -> rx.Component:
+        custom_attrs = props.pop("custom_attrs", {})
+        custom_attrs.setdefault(
+            "onMount", rx.Var("(editor) => window.codocSync.attach(editor)")
+        )
+        custom_attrs.setdefault(
+            "onChange",
+            rx.Var("(value, event) => window.codocSync.localChange(event)"),
+        )
+        return super().create(*children, custom_attrs=custom_attrs, **props)
+
+    def add_custom_code(self) -> list[str]:
+        return [_SYNC_JS, _PRESENCE_JS]
+
+    def add_hooks(self) -> list[str | rx.Var]:
+        send = rx.Var.create(DocumentState.apply_edits(rx.Var("batch")))
+        catch_up = rx.Var.create(DocumentState.sync_document(rx.Var("since")))
+        events = VarData(
+            imports={**Imports.EVENTS, "react": ["useContext", "useEffect"]},
+            hooks={Hooks.EVENTS: None},
+        )
+        last_edit = DocumentState.last_edit
+        return [
+            rx.Var(
+                "useEffect(() => { window.codocSync.connect({ "
+                f"send: (batch) => addEvents([{send}], [], {{}}), "
+                f"catchUp: (since) => addEvents([{catch_up}], [], {{}}) "
+                "}); }, [addEvents]);",
+                _var_data=events,
+            ),
+            rx.Var(
+                f"useEffect(() => {{ window.codocSync.receive({last_edit}); }}, "
+                f"[{last_edit}]);",
+                _var_data=VarData.merge(
+                    last_edit._get_all_var_data(),
+                    VarData(imports={"react": ["useEffect"]}),
+                ),
+            ),
+        ]
+
+
+collab_editor = CollabMonacoEditor.create
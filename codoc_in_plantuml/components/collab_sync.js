@@ -0,0 +1,357 @@
+// Operation-based sync between the Monaco editor and DocumentState.
+//
+// Mirrors codoc_in_plantuml/utils/text_ops.py: an operation is an array where
+// a positive number retains, a negative number deletes and a string inserts.
+// The client follows the ot.js protocol: at most one batch is in flight
+// ("outstanding") and edits made meanwhile are composed into "buffer", both
+// transformed against remote batches as they arrive. Every batch the server
+// applies carries the new document version; a gap in versions means missed
+// batches, which are fetched with a catch-up request.
+(function (root) {
+  "use strict";
+
+  const isRetain = (op) => typeof op === "number" && op > 0;
+  const isDelete = (op) => typeof op === "number" && op < 0;
+  const isInsert = (op) => typeof op === "string";
+
+  function builder() {
+    const ops = [];
+    return {
+      ops,
+      retain(n) {
+        if (n <= 0) return this;
+        if (ops.length && isRetain(ops[ops.length - 1])) ops[ops.length - 1] += n;
+        else ops.push(n);
+        return this;
+      },
+      insert(text) {
+        if (!text) return this;
+        const last = ops.length - 1;
+        if (last >= 0 && isInsert(ops[last])) ops[last] += text;
+        else if (last >= 0 && isDelete(ops[last])) {
+          if (last > 0 && isInsert(ops[last - 1])) ops[last - 1] += text;
+          else ops.splice(last, 0, text);
+        } else ops.push(text);
+        return this;
+      },
+      delete(n) {
+        if (n <= 0) return this;
+        if (ops.length && isDelete(ops[ops.length - 1])) ops[ops.length - 1] -= n;
+        else ops.push(-n);
+        return this;
+      },
+    };
+  }
+
+  function baseLength(ops) {
+    let n = 0;
+    for (const op of ops) if (!isInsert(op)) n += Math.abs(op);
+    return n;
+  }
+
+  function targetLength(ops) {
+    let n = 0;
+    for (const op of ops) if (isInsert(op)) n += op.length;
+    else if (isRetain(op)) n += op;
+    return n;
+  }
+
+  function isNoop(ops) {
+    return ops.length === 0 || (ops.length === 1 && isRetain(ops[0]));
+  }
+
+  function apply(ops, text) {
+    if (baseLength(ops) !== text.length) {
+      throw new Error("operation does not match the document length");
+    }
+    const parts = [];
+    let index = 0;
+    for (const op of ops) {
+      if (isInsert(op)) parts.push(op);
+      else if (isRetain(op)) {
+        parts.push(text.slice(index, index + op));
+        index += op;
+      } else index -= op;
+    }
+    return parts.join("");
+  }
+
+  // Consume ``n`` units of ``op``; returns the remainder or null when used up.
+  function advance(op, n) {
+    if (isInsert(op)) return op.length === n ? null : op.slice(n);
+    if (op > 0) return op > n ? op - n : null;
+    return op < -n ? op + n : null;
+  }
+
+  function iterator(ops) {
+    let i = 0;
+    return () => (i < ops.length ? ops[i++] : null);
+  }
+
+  function compose(a, b) {
+    const result = builder();
+    const nextA = iterator(a);
+    const nextB = iterator(b);
+    let op1 = nextA();
+    let op2 = nextB();
+    while (op1 !== null || op2 !== null) {
+      if (op1 !== null && isDelete(op1)) {
+        result.delete(-op1);
+        op1 = nextA();
+        continue;
+      }
+      if (op2 !== null && isInsert(op2)) {
+        result.insert(op2);
+        op2 = nextB();
+        continue;
+      }
+      if (op1 === null || op2 === null) throw new Error("operations do not compose");
+      let n;
+      if (isRetain(op1) && isRetain(op2)) {
+        n = Math.min(op1, op2);
+        result.retain(n);
+      } else if (isInsert(op1) && isDelete(op2)) {
+        n = Math.min(op1.length, -op2);
+      } else if (isInsert(op1)) {
+        n = Math.min(op1.length, op2);
+        result.insert(op1.slice(0, n));
+      } else {
+        n = Math.min(op1, -op2);
+        result.delete(n);
+      }
+      op1 = advance(op1, n) ?? nextA();
+      op2 = advance(op2, n) ?? nextB();
+    }
+    return result.ops;
+  }
+
+  // Transform concurrent ``a`` and ``b`` into [a', b']; ``a``'s inserts go
+  // first on ties, matching TextOperation.transform on the server.
+  function transform(a, b) {
+    const aPrime = builder();
+    const bPrime = builder();
+    const nextA = iterator(a);
+    const nextB = iterator(b);
+    let op1 = nextA();
+    let op2 = nextB();
+    while (op1 !== null || op2 !== null) {
+      if (op1 !== null && isInsert(op1)) {
+        aPrime.insert(op1);
+        bPrime.retain(op1.length);
+        op1 = nextA();
+        continue;
+      }
+      if (op2 !== null && isInsert(op2)) {
+        aPrime.retain(op2.length);
+        bPrime.insert(op2);
+        op2 = nextB();
+        continue;
+      }
+      if (op1 === null || op2 === null) throw new Error("operations do not transform");
+      let n;
+      if (isRetain(op1) && isRetain(op2)) {
+        n = Math.min(op1, op2);
+        aPrime.retain(n);
+        bPrime.retain(n);
+      } else if (isDelete(op1) && isDelete(op2)) {
+        n = Math.min(-op1, -op2);
+      } else if (isDelete(op1)) {
+        n = Math.min(-op1, op2);
+        aPrime.delete(n);
+      } else {
+        n = Math.min(op1, -op2);
+        bPrime.delete(n);
+      }
+      op1 = advance(op1, n) ?? nextA();
+      op2 = advance(op2, n) ?? nextB();
+    }
+    return [aPrime.ops, bPrime.ops];
+  }
+
+  // One operation for a Monaco content change event. The changes in an event
+  // are non-overlapping and all relative to the previous model, so applying
+  // them from the end of the document backwards keeps every offset valid.
+  function fromMonacoChanges(changes, length) {
+    let ops = builder().retain(length).ops;
+    const sorted = [...changes].sort((x, y) => y.rangeOffset - x.rangeOffset);
+    for (const change of sorted) {
+      const step = builder()
+        .retain(change.rangeOffset)
+        .delete(change.rangeLength)
+        .insert(change.text)
+        .retain(length - change.rangeOffset - change.rangeLength).ops;
+      ops = compose(ops, step);
+      length = targetLength(step);
+    }
+    return ops;
+  }
+
+  // Monaco edits for an operation, with ranges in the current model.
+  function toMonacoEdits(ops, model) {
+    const edits = [];
+    let index = 0;
+    for (const op of ops) {
+      if (isRetain(op)) {
+        index += op;
+      } else if (isInsert(op)) {
+        const at = model.getPositionAt(index);
+        edits.push({
+          range: {
+            startLineNumber: at.lineNumber,
+            startColumn: at.column,
+            endLineNumber: at.lineNumber,
+            endColumn: at.column,
+          },
+          text: op,
+        });
+      } else {
+        const start = model.getPositionAt(index);
+        const end = model.getPositionAt(index - op);
+        edits.push({
+          range: {
+            startLineNumber: start.lineNumber,
+            startColumn: start.column,
+            endLineNumber: end.lineNumber,
+            endColumn: end.column,
+          },
+          text: "",
+        });
+        index -= op;
+      }
+    }
+    return edits;
+  }
+
+  class SyncClient {
+    constructor() {
+      this.clientId = Math.random().toString(36).slice(2, 12);
+      this.seq = 0;
+      this.version = -1;
+      this.text = "";
+      this.outstanding = null;
+      this.buffer = null;
+      this.editor = null;
+      this.transport = null;
+      this.applyingRemote = false;
+      this.catchingUp = false;
+    }
+
+    // ``transport`` is {send(batch), catchUp(since)}, bound to Reflex events.
+    connect(transport) {
+      this.transport = transport;
+    }
+
+    attach(editor) {
+      this.editor = editor;
+      if (this.version >= 0) this.setEditorText(this.text);
+    }
+
+    setEditorText(text) {
+      const model = this.editor && this.editor.getModel();
+      if (!model || model.getValue() === text) return;
+      this.applyingRemote = true;
+      try {
+        model.setValue(text);
+      } finally {
+        this.applyingRemote = false;
+      }
+    }
+
+    // Full document from the server; unacknowledged local edits are dropped.
+    load(snapshot) {
+      this.version = snapshot.version;
+      this.text = snapshot.code;
+      this.outstanding = null;
+      this.buffer = null;
+      this.catchingUp = false;
+      this.setEditorText(this.text);
+    }
+
+    // Monaco onChange handler.
+    localChange(event) {
+      if (this.applyingRemote || !event || this.version < 0) return;
+      const ops = fromMonacoChanges(event.changes, this.text.length);
+      const model = this.editor && this.editor.getModel();
+      if (model && targetLength(ops) !== model.getValueLength()) {
+        // The editor and the shadow copy disagree; start over from the server.
+        this.requestCatchUp(-1);
+        return;
+      }
+      this.text = apply(ops, this.text);
+      if (this.buffer) this.buffer = compose(this.buffer, ops);
+      else if (this.outstanding) this.buffer = ops;
+      else {
+        this.outstanding = ops;
+        this.send(ops);
+      }
+    }
+
+    send(ops) {
+      this.seq += 1;
+      this.sentSeq = this.seq;
+      if (this.transport) {
+        this.transport.send({
+          version: this.version,
+          client: this.clientId,
+          seq: this.seq,
+          ops,
+        });
+      }
+    }
+
+    requestCatchUp(since) {
+      if (this.catchingUp || !this.transport) return;
+      this.catchingUp = true;
+      this.transport.catchUp(since === undefined ? this.version : since);
+    }
+
+    // A batch the server applied: either our outstanding one coming back as
+    // the acknowledgement, or someone else's edit to merge in.
+    receive(batch) {
+      if (!batch || batch.version === undefined || this.version < 0) return;
+      if (batch.version <= this.version) return;
+      if (batch.version > this.version + 1) {
+        this.requestCatchUp();
+        return;
+      }
+      this.version = batch.version;
+      if (
+        this.outstanding &&
+        batch.client === this.clientId &&
+        batch.seq === this.sentSeq
+      ) {
+        this.outstanding = this.buffer;
+        this.buffer = null;
+        if (this.outstanding) this.send(this.outstanding);
+        return;
+      }
+      let ops = batch.ops;
+      if (this.outstanding) [this.outstanding, ops] = transform(this.outstanding, ops);
+      if (this.buffer) [this.buffer, ops] = transform(this.buffer, ops);
+      this.applyRemote(ops);
+    }
+
+    receiveAll(batches) {
+      this.catchingUp = false;
+      for (const batch of batches) this.receive(batch);
+    }
+
+    applyRemote(ops) {
+      if (isNoop(ops)) return;
+      const model = this.editor && this.editor.getModel();
+      if (model) {
+        this.applyingRemote = true;
+        try {
+          model.applyEdits(toMonacoEdits(ops, model));
+        } finally {
+          this.applyingRemote = false;
+        }
+      }
+      this.text = apply(ops, this.text);
+    }
+  }
+
+  const api = { apply, compose, transform, fromMonacoChanges, toMonacoEdits, SyncClient };
+  if (typeof module !== "undefined" && module.exports) module.exports = api;
+  else if (!root.codocSync) root.codocSync = new SyncClient();
+})(typeof window !== "undefined" ? window : globalThis);
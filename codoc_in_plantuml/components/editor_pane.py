@@ -1,7 +1,6 @@
 import reflex as rx
-import reflex_monaco
+from codoc_in_plantuml.components.collab_editor import collab_editor
 from codoc_in_plantuml.states.editor_state import EditorState
-from codoc_in_plantuml.states.document_state import DocumentState
 
 
 def editor_pane() -> rx.Component:
@@ -17,9 +16,7 @@ def editor_pane() -> rx.Component:
             class_name="flex items-center justify-between px-4 py-3 bg-[#252526] border-b border-[#333]",
         ),
         rx.el.div(
-            reflex_monaco.monaco(
-                value=DocumentState.code,
-                on_change=DocumentState.update_code.debounce(500),
+            collab_editor(
                 language="plantuml",
                 theme="vs-dark",
                 options={
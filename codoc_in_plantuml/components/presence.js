@@ -0,0 +1,53 @@
+// Presence heartbeats for the open document.
+//
+// Sent as plain HTTP requests to the backend's presence endpoint rather than
+// as Reflex events: an event from any tab in a room is applied to the shared
+// DocumentState and fanned out to every other tab, which heartbeats must not
+// cost. Joining happens in EditorState.on_load, which calls start().
+(function (root) {
+  "use strict";
+
+  class PresenceClient {
+    constructor() {
+      this.target = null;
+      this.timer = null;
+    }
+
+    start({ url, room, token, interval }) {
+      this.target = { url, room, token };
+      if (this.timer) clearInterval(this.timer);
+      this.timer = setInterval(() => this.beat(), interval * 1000);
+    }
+
+    post(body, beacon) {
+      if (!this.target) return;
+      const { url, room, token } = this.target;
+      const payload = JSON.stringify({ room, token, ...body });
+      // A text/plain body keeps the cross-origin request "simple" (no CORS
+      // preflight); the response is never read.
+      if (beacon && navigator.sendBeacon) {
+        navigator.sendBeacon(url, payload);
+        return;
+      }
+      fetch(url, { method: "POST", body: payload, mode: "no-cors", keepalive: true })
+        .catch(() => {});
+    }
+
+    beat() {
+      this.post({}, false);
+    }
+
+    // Sent while the page is going away, so it must not wait for a response.
+    leave() {
+      this.post({ leave: true }, true);
+    }
+  }
+
+  const client = new PresenceClient();
+  if (typeof module !== "undefined" && module.exports) {
+    module.exports = { PresenceClient };
+  } else if (!root.codocPresence) {
+    root.codocPresence = client;
+    root.addEventListener("pagehide", () => client.leave());
+  }
+})(typeof window !== "undefined" ? window : globalThis);
@@ -13,20 +13,43 @@ def preview_pane() -> rx.Component:
                 ),
                 class_name="flex items-center gap-2",
             ),
+            rx.cond(
+                (DocumentState.render_status == "pending")
+                | (DocumentState.render_status == "rendering"),
+                rx.el.div(
+                    rx.icon("loader-circle", class_name="w-3.5 h-3.5 animate-spin"),
+                    rx.el.span("Rendering"),
+                    class_name="flex items-center gap-1.5 text-xs text-gray-500",
+                ),
+            ),
             class_name="flex items-center justify-between px-4 py-3 bg-gray-50 border-b border-gray-200",
         ),
         rx.el.div(
             rx.el.div(
                 rx.el.div(
-                    rx.el.img(
-                        src=DocumentState.diagram_url,
-                        class_name="max-w-none shadow-sm rounded bg-white",
-                        draggable=False,
+                    rx.foreach(
+                        DocumentState.diagram_urls,
+                        lambda url: rx.el.img(
+                            src=url,
+                            class_name="max-w-none shadow-sm rounded bg-white",
+                            draggable=False,
+                        ),
                     ),
-                    class_name="inline-block p-8 min-w-full min-h-full flex items-center justify-center",
+                    class_name="inline-block p-8 min-w-full min-h-full flex flex-col items-center justify-center gap-8",
                 ),
                 class_name="h-full w-full flex items-center justify-center",
             ),
+            rx.cond(
+                DocumentState.render_status == "error",
+                rx.el.div(
+                    rx.icon("triangle-alert", class_name="w-4 h-4 shrink-0"),
+                    rx.el.span(
+                        DocumentState.render_error,
+                        class_name="whitespace-pre-line line-clamp-3",
+                    ),
+                    class_name="absolute top-3 left-3 right-3 flex items-center gap-2 px-3 py-2 rounded-md bg-red-50 border border-red-200 text-red-700 text-xs font-mono shadow-sm",
+                ),
+            ),
             class_name="flex-1 overflow-auto bg-[url('/grid-pattern.svg')] bg-gray-100 relative custom-scrollbar",
         ),
         class_name="flex flex-col h-full w-full bg-gray-50",
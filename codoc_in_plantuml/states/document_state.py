@@ -2,15 +2,52 @@ import reflex as rx
 import random
 import string
 import asyncio
+import json
+import logging
+import time
 from typing import Any
 from pydantic import BaseModel
+from reflex.state import _substate_key
+from reflex.istate.manager import get_state_manager
+from codoc_in_plantuml.utils.blocks import find_syntax_error
+from codoc_in_plantuml.utils.diagram_types import classify
+from codoc_in_plantuml.utils.document_store import get_document_store
+from codoc_in_plantuml.utils.graph import VisualGraph
+from codoc_in_plantuml.utils.metrics import registry
 from codoc_in_plantuml.utils.plantuml import PlantUML
+from codoc_in_plantuml.utils.presence import presence
+from codoc_in_plantuml.utils.render_scheduler import render_scheduler
+from codoc_in_plantuml.utils.rooms import rooms
+from codoc_in_plantuml.utils.text_ops import TextOperation, text_length
+
+
+_preview_seconds = registry.histogram(
+    "codoc_plantuml_preview_seconds",
+    "Time from starting a preview render to publishing it, including queueing.",
+)
+_edit_batches = registry.counter(
+    "codoc_plantuml_edit_batches_total",
+    "Edit batches received from editors, by outcome (applied or resync).",
+    ("outcome",),
+)
+_presence_publishes = registry.counter(
+    "codoc_plantuml_presence_publishes_total",
+    "Member lists sent to rooms after joins, leaves and expiries.",
+)
+_room_evictions = registry.counter(
+    "codoc_plantuml_room_evictions_total",
+    "Rooms dropped from memory, by reason (idle or memory).",
+    ("reason",),
+)
+
+# Applied batches kept per room, for transforming late batches and for
+# catching up clients that missed broadcasts. Older clients get a snapshot.
+HISTORY_LIMIT = 500
 
 
 class UserInfo(BaseModel):
     name: str
     color: str
-    token: str
 
 
 class DocumentState(rx.SharedState):
@@ -29,158 +66,420 @@ deactivate Server
 App --> User: Display Diagram
 deactivate App
 @enduml"""
-    _diagram_type: str = "Sequence"
-    _visual_nodes: list[dict[str, str]] = []
-    _visual_edges: list[dict[str, str]] = []
-    _users: dict[str, UserInfo] = {}
+    # Visual editor nodes ``{"id", "type", "label"}`` and edges
+    # ``{"id", "source", "target"}``. Events bump the counters of the side
+    # they changed, so a relabel does not resend every edge.
+    _graph: VisualGraph = VisualGraph()
+    _node_changes: int = 0
+    _edge_changes: int = 0
+    # Number of edit batches applied to ``_code``, and the most recent of
+    # them as ``{"version", "client", "seq", "ops"}``, oldest first.
+    _version: int = 0
+    _history: list[dict[str, Any]] = []
+    # Whether the room was looked up in the document store since it was
+    # created in memory.
+    _restored: bool = False
+    # Code behind the images in ``diagram_urls``: the room's last good render,
+    # which stays on screen until a newer render succeeds.
+    _rendered_code: str = ""
+    diagram_urls: list[str] = []
+    # "idle", "pending" (edit not yet picked up), "rendering" or "error".
+    render_status: str = "idle"
+    render_error: str = ""
+    # The latest applied batch. Editors merge it into their copy of the
+    # document, so each edit is broadcast as operations rather than as text.
+    last_edit: dict[str, Any] = {}
+    # Everyone with a live heartbeat, set only by ``publish_presence``.
+    active_users: list[UserInfo] = []
 
-    @rx.var
-    def code(self) -> str:
-        return self._code
-
-    @rx.var
+    # Derived vars list their dependencies so that only changes to those
+    # backend vars recompute and resend them.
+    @rx.var(deps=["_code"], auto_deps=False)
     def diagram_type(self) -> str:
-        return self._diagram_type
+        return classify(self._code).type
 
-    @rx.var
+    @rx.var(deps=["_node_changes"], auto_deps=False)
     def visual_nodes(self) -> list[dict[str, str]]:
-        return self._visual_nodes
+        return self._graph.node_list()
 
-    @rx.var
+    @rx.var(deps=["_edge_changes"], auto_deps=False)
     def visual_edges(self) -> list[dict[str, str]]:
-        return self._visual_edges
-
-    @rx.var
-    def active_users(self) -> list[UserInfo]:
-        return list(self._users.values())
-
-    @rx.var
-    def diagram_url(self) -> str:
-        format_type = "svg"
-        if "@startditaa" in self._code.lower():
-            format_type = "png"
-        return PlantUML.get_image_source(self._code, format=format_type)
-
-    def _get_user_color(self) -> str:
-        colors = [
-            "bg-red-500",
-            "bg-orange-500",
-            "bg-amber-500",
-            "bg-yellow-500",
-            "bg-lime-500",
-            "bg-green-500",
-            "bg-emerald-500",
-            "bg-teal-500",
-            "bg-cyan-500",
-            "bg-sky-500",
-            "bg-blue-500",
-            "bg-indigo-500",
-            "bg-violet-500",
-            "bg-purple-500",
-            "bg-fuchsia-500",
-            "bg-pink-500",
-            "bg-rose-500",
-        ]
-        return random.choice(colors)
+        return self._graph.edge_list()
 
-    @rx.event
-    async def join_room(self):
-        token = self.router.session.client_token
-        if token not in self._users:
-            adjectives = [
-                "Swift",
-                "Calm",
-                "Bright",
-                "Eager",
-                "Merry",
-                "Witty",
-                "Brave",
-                "Jolly",
-                "Kind",
-            ]
-            nouns = [
-                "Fox",
-                "Bear",
-                "Owl",
-                "Cat",
-                "Dog",
-                "Lion",
-                "Tiger",
-                "Hawk",
-                "Wolf",
+    async def _internal_patch_linked_state(
+        self, token: str, full_delta: bool = False
+    ) -> "DocumentState":
+        # Every event in a room passes through here, so this is where room
+        # activity is recorded and evicted rooms are brought back.
+        linked_state = await super()._internal_patch_linked_state(token, full_delta)
+        if rooms.touch(token):
+            # Reload even if the state manager kept an older copy on disk.
+            linked_state._restored = False
+        await linked_state._restore()
+        return linked_state
+
+    async def _restore(self) -> None:
+        """Load the room from the document store the first time it is linked."""
+        if self._restored or not self._linked_to:
+            return
+        self._restored = True
+        members = presence.members(self._linked_to)
+        if members:
+            # Evicted while people still had it open.
+            self.active_users = [
+                UserInfo(name=name, color=color) for name, color in members
             ]
-            name = f"{random.choice(adjectives)} {random.choice(nouns)}"
-            self._users[token] = UserInfo(
-                name=name, color=self._get_user_color(), token=token
+        store = get_document_store()
+        if store is None:
+            return
+        stored = await asyncio.to_thread(store.load, self._linked_to, self._code)
+        if stored is None:
+            return
+        self._code = stored.code
+        self._version = stored.version
+        self._history = []
+        self._graph = VisualGraph.from_lists(stored.nodes, stored.edges)
+        self._node_changes += 1
+        self._edge_changes += 1
+
+    def _approximate_size(self) -> int:
+        """Rough number of bytes the room holds, for the memory budget."""
+        history = sum(
+            len(op) if isinstance(op, str) else 8
+            for batch in self._history
+            for op in batch["ops"]
+        )
+        entries = len(self._history) + len(self._graph)
+        return (
+            len(self._code)
+            + len(self._rendered_code)
+            + sum(len(url) for url in self.diagram_urls)
+            + history
+            + 200 * entries
+        )
+
+    def _graph_changed(self, nodes: bool = False, edges: bool = False) -> None:
+        if nodes:
+            self._node_changes += 1
+        if edges:
+            self._edge_changes += 1
+        self._persist_graph()
+
+    def _persist_graph(self) -> None:
+        store = get_document_store()
+        if store is not None and self._linked_to:
+            graph = self._graph
+            store.save_graph(self._linked_to, graph.node_list(), graph.edge_list())
+
+    def _apply_operation(
+        self,
+        operation: TextOperation,
+        client: str = "",
+        seq: int = 0,
+        code: str | None = None,
+    ) -> dict[str, Any]:
+        """Commit ``operation``; ``code`` is its result if already applied."""
+        self._code = operation.apply(self._code) if code is None else code
+        self._version += 1
+        batch = {
+            "version": self._version,
+            "client": client,
+            "seq": seq,
+            "ops": operation.to_json(),
+        }
+        self._history.append(batch)
+        del self._history[:-HISTORY_LIMIT]
+        self.last_edit = batch
+        if self._code != self._rendered_code:
+            self._set_render_status(self._code, "pending")
+        store = get_document_store()
+        if store is not None and self._linked_to:
+            store.append_edit(
+                self._linked_to, self._version, batch["ops"], self._code
             )
+            if self._version % store.snapshot_every == 0:
+                store.save_snapshot(self._linked_to, self._version, self._code)
+        return batch
+
+    def _snapshot_script(self) -> rx.event.EventSpec:
+        snapshot = {"version": self._version, "code": self._code}
+        return rx.call_script(f"window.codocSync.load({json.dumps(snapshot)})")
 
     @rx.event
     def update_code(self, new_code: str):
-        self._code = new_code
-        self.detect_type(new_code)
+        """Replace the whole document, e.g. with an example snippet."""
+        if new_code == self._code:
+            return
+        try:
+            operation = TextOperation.replace(self._code, new_code)
+        except ValueError as e:
+            # Lone surrogates, which UTF-16 offsets cannot address.
+            logging.info(f"Rejected document replacement: {e}")
+            return
+        self._apply_operation(operation, code=new_code)
+        return DocumentState.render_diagram
 
     @rx.event
-    def detect_type(self, code: str):
-        code_lower = code.lower()
-        if (
-            "participant" in code_lower
-            or "sequence" in code_lower
-            or "->" in code_lower
-        ):
-            self._diagram_type = "Sequence"
-        elif "class" in code_lower or "interface" in code_lower:
-            self._diagram_type = "Class"
-        elif "usecase" in code_lower or "actor" in code_lower:
-            self._diagram_type = "Use Case"
-        elif "activity" in code_lower or ":start" in code_lower or "fork" in code_lower:
-            self._diagram_type = "Activity"
-        elif "state" in code_lower or "[*]" in code_lower:
-            self._diagram_type = "State"
-        elif "component" in code_lower or "database" in code_lower:
-            self._diagram_type = "Component"
-        elif "json" in code_lower:
-            self._diagram_type = "JSON"
-        elif "yaml" in code_lower:
-            self._diagram_type = "YAML"
-        elif "mindmap" in code_lower:
-            self._diagram_type = "MindMap"
-        elif "gantt" in code_lower:
-            self._diagram_type = "Gantt"
-        else:
-            self._diagram_type = "Unknown"
+    async def restore_version(self, version: int):
+        """Bring back an earlier revision, as an edit on top of the current one."""
+        store = get_document_store()
+        if store is None or not self._linked_to:
+            return
+        code = await asyncio.to_thread(store.load_version, self._linked_to, version)
+        if code is None or code == self._code:
+            return
+        try:
+            operation = TextOperation.replace(self._code, code)
+        except ValueError as e:
+            logging.warning(f"Cannot restore {self._linked_to} at {version}: {e}")
+            return
+        self._apply_operation(operation, code=code)
+        return DocumentState.render_diagram
+
+    @rx.event
+    def apply_edits(self, batch: dict[str, Any]):
+        """Merge an editor's batch of edits into the shared document.
+
+        ``batch["version"]`` is the document version the client's operation
+        was made against; batches applied since then are transformed into it
+        before it is applied. The sender gets the applied batch back as its
+        acknowledgement, everyone else through ``last_edit``. A batch that
+        is too old or does not fit gets the sender a fresh snapshot instead.
+        """
+        try:
+            operation = TextOperation.from_json(batch["ops"])
+            base = int(batch["version"])
+            client, seq = str(batch.get("client", "")), int(batch.get("seq", 0))
+            missed = self._version - base
+            if base < 0 or missed < 0 or missed > len(self._history):
+                raise ValueError(f"cannot rebase from version {base}")
+            for applied in self._history[len(self._history) - missed :]:
+                operation, _ = TextOperation.transform(
+                    operation, TextOperation.from_json(applied["ops"])
+                )
+            if operation.base_length != text_length(self._code):
+                raise ValueError("operation does not fit the document")
+            code = operation.apply(self._code)
+        except (KeyError, TypeError, ValueError) as e:
+            logging.info(f"Resyncing editor after rejected edit batch: {e}")
+            _edit_batches.inc(outcome="resync")
+            return self._snapshot_script()
+        _edit_batches.inc(outcome="applied")
+        applied = self._apply_operation(operation, client, seq, code)
+        return [
+            rx.call_script(f"window.codocSync.receive({json.dumps(applied)})"),
+            DocumentState.render_diagram,
+        ]
+
+    @rx.event
+    def sync_document(self, since: int):
+        """Send the calling editor the batches after ``since``, or a snapshot."""
+        missed = self._version - since
+        if since < 0 or missed < 0 or missed > len(self._history):
+            return self._snapshot_script()
+        batches = self._history[len(self._history) - missed :] if missed else []
+        return rx.call_script(f"window.codocSync.receiveAll({json.dumps(batches)})")
+
+    def _set_render_status(self, code: str, status: str, error: str = "") -> None:
+        # Only the render of the current code may report; older ones are stale.
+        # Assigning marks a var dirty even when the value is unchanged, and
+        # every dirty var is sent to the whole room.
+        if self._code != code:
+            return
+        if self.render_status != status:
+            self.render_status = status
+        if self.render_error != error:
+            self.render_error = error
+
+    @rx.event(background=True)
+    async def render_diagram(self):
+        """Render the current code off the event loop and publish one image per block."""
+        async with self:
+            code = self._code
+            if code == self._rendered_code:
+                self._set_render_status(code, "idle")
+                return
+            room_id = self._linked_to or self.router.session.client_token
+            # Most keystrokes leave the text structurally incomplete; flag that
+            # without a render and keep the last good diagram on screen.
+            error = find_syntax_error(code)
+            if error is not None:
+                self._set_render_status(code, "error", error)
+                return
+            self._set_render_status(code, "rendering")
+        start = time.perf_counter()
+        try:
+            urls = await render_scheduler.submit(
+                room_id, lambda: PlantUML.get_block_sources_async(code)
+            )
+        except (RuntimeError, OSError) as e:
+            logging.warning(f"PlantUML render failed: {e}")
+            async with self:
+                self._set_render_status(code, "error", str(e))
+            return
+        except Exception as e:
+            # Still report it, or the status would stay "rendering" for good.
+            logging.exception("Unexpected PlantUML render failure")
+            async with self:
+                self._set_render_status(code, "error", f"Render failed: {e!r}")
+            return
+        if urls is None:
+            # A newer edit in this room took over; its render will publish.
+            return
+        async with self:
+            # Swap in the new images in one delta, and only if the code is
+            # still current; otherwise the last good render stays up.
+            if self._code == code:
+                self.diagram_urls = urls
+                self._rendered_code = code
+                self._set_render_status(code, "idle")
+                _preview_seconds.observe(time.perf_counter() - start)
 
     @rx.event
     def add_node(self, node_type: str):
         new_id = "".join(random.choices(string.ascii_lowercase + string.digits, k=6))
-        self._visual_nodes.append(
+        if self._graph.add_node(
             {
                 "id": f"{node_type}_{new_id}",
                 "type": node_type,
                 "label": node_type.title(),
             }
-        )
+        ):
+            self._graph_changed(nodes=True)
 
     @rx.event
     def delete_node(self, node_id: str):
-        self._visual_nodes = [n for n in self._visual_nodes if n["id"] != node_id]
-        self._visual_edges = [
-            e
-            for e in self._visual_edges
-            if e["source"] != node_id and e["target"] != node_id
-        ]
+        graph = self._graph
+        had_edges = node_id in graph.outgoing or node_id in graph.incoming
+        if graph.remove_node(node_id):
+            self._graph_changed(nodes=True, edges=had_edges)
 
     @rx.event
     def update_node_label(self, node_id: str, new_label: str):
-        for node in self._visual_nodes:
-            if node["id"] == node_id:
-                node["label"] = new_label
-                break
+        if self._graph.update_node(node_id, label=new_label):
+            self._graph_changed(nodes=True)
 
     @rx.event
     def add_edge(self, source: str, target: str):
+        graph = self._graph
+        if source not in graph.nodes or target not in graph.nodes:
+            return
         edge_id = "".join(random.choices(string.ascii_lowercase + string.digits, k=6))
-        self._visual_edges.append({"id": edge_id, "source": source, "target": target})
+        if graph.add_edge({"id": edge_id, "source": source, "target": target}):
+            self._graph_changed(edges=True)
 
     @rx.event
     def delete_edge(self, edge_id: str):
-        self._visual_edges = [e for e in self._visual_edges if e["id"] != edge_id]
\ No newline at end of file
+        if self._graph.remove_edge(edge_id):
+            self._graph_changed(edges=True)
+
+
+async def _evict_room(manager, room: str, seen: float, reason: str) -> bool:
+    async with manager.modify_state(_substate_key(room, DocumentState)) as root:
+        if rooms.last_active(room) != seen:
+            # Someone used the room while we waited for its lock.
+            return False
+        doc = await root.get_state(DocumentState)
+        if doc._version or doc._graph:
+            store = get_document_store()
+            if store is None:
+                # Nowhere to spill the edits to; keep the room.
+                return False
+            # Not flushed: loading the room again merges what is still queued.
+            store.save_snapshot(room, doc._version, doc._code)
+            doc._persist_graph()
+        manager.states.pop(room, None)
+        rooms.evicted(room)
+    _room_evictions.inc(reason=reason)
+    return True
+
+
+async def evict_rooms(ttl: float, budget: int) -> int:
+    """Drop rooms idle for ``ttl`` seconds, then the least recently used
+    ones while all rooms together hold more than ``budget`` bytes. Rooms
+    someone has open are kept either way.
+
+    Edited rooms are snapshotted to the document store first and reloaded
+    from it on their next access; rooms nobody edited are simply dropped.
+    Returns the number of rooms evicted.
+    """
+    manager = get_state_manager()
+    states = getattr(manager, "states", None)
+    if states is None:
+        # Redis expires idle states on its own.
+        return 0
+    sizes = {}
+    for room, _ in rooms.least_recent():
+        root = states.get(room)
+        if root is None:
+            # The state manager expired it; reload from the store next time.
+            rooms.evicted(room)
+            continue
+        sizes[room] = (await root.get_state(DocumentState))._approximate_size()
+    total = sum(sizes.values())
+    cutoff = time.monotonic() - ttl
+    evicted = 0
+    for room, seen in rooms.least_recent():
+        if presence.tokens(room):
+            # Someone still has it open. A room recreated by the state manager
+            # would not know their tabs, and they would stop receiving edits.
+            continue
+        if seen < cutoff:
+            reason = "idle"
+        elif total > budget:
+            reason = "memory"
+        else:
+            break
+        if await _evict_room(manager, room, seen, reason):
+            total -= sizes.get(room, 0)
+            evicted += 1
+    return evicted
+
+
+_publish_tasks: set[asyncio.Task] = set()
+
+
+async def has_session(token: str) -> bool:
+    """Whether the state manager holds a session for client ``token``."""
+    manager = get_state_manager()
+    states = getattr(manager, "states", None)
+    if states is not None:
+        return token in states
+    redis = getattr(manager, "redis", None)
+    if redis is not None:
+        return bool(await redis.exists(_substate_key(token, DocumentState)))
+    return False
+
+
+def publish_presence(room: str) -> None:
+    """Send ``room``'s member list to its clients soon.
+
+    Changes that arrive before the publish runs are folded into it, so a
+    room is republished at most every ``presence.interval`` seconds.
+    """
+    delay = presence.schedule_publish(room)
+    if delay is None:
+        return
+    task = asyncio.get_running_loop().create_task(_publish_presence(room, delay))
+    _publish_tasks.add(task)
+    task.add_done_callback(_publish_tasks.discard)
+
+
+async def _publish_presence(room: str, delay: float) -> None:
+    from reflex.utils.prerequisites import get_app
+
+    await asyncio.sleep(delay)
+    presence.published(room)
+    users = [UserInfo(name=name, color=color) for name, color in presence.members(room)]
+    app = get_app().app
+    # Setting the var through any one member's session updates the shared
+    # room, and Reflex fans the change out to everyone linked to it.
+    for token in presence.tokens(room):
+        async with app.modify_state(_substate_key(token, DocumentState)) as root:
+            doc = await root.get_state(DocumentState)
+            if doc._linked_to != room:
+                continue
+            if users != doc.active_users:
+                doc.active_users = users
+                _presence_publishes.inc()
+        return
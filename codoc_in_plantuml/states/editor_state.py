@@ -1,7 +1,13 @@
+import json
 import re
 import reflex as rx
 from pydantic import BaseModel, Field
 from codoc_in_plantuml.utils.plantuml import PlantUML
+from codoc_in_plantuml.utils.presence import (
+    HEARTBEAT_SECONDS,
+    PRESENCE_ROUTE,
+    presence,
+)
 
 
 def _slugify(text: str) -> str:
@@ -78,11 +84,36 @@ class EditorState(rx.State):
         if sanitized_id != share_id:
             return rx.redirect(f"/doc/{sanitized_id}")
         self.current_doc_id = sanitized_id
-        from codoc_in_plantuml.states.document_state import DocumentState
+        from reflex.config import get_config
+        from codoc_in_plantuml.states.document_state import (
+            DocumentState,
+            publish_presence,
+        )
 
         doc_state = await self.get_state(DocumentState)
         linked_doc = await doc_state._link_to(self.current_doc_id)
-        await linked_doc.join_room()
+        token = self.router.session.client_token
+        for room in presence.join(self.current_doc_id, token):
+            publish_presence(room)
+        events = [
+            DocumentState.sync_document(-1),
+            rx.call_script(
+                "window.codocPresence.start("
+                + json.dumps(
+                    {
+                        "url": get_config().api_url.rstrip("/") + PRESENCE_ROUTE,
+                        "room": self.current_doc_id,
+                        "token": token,
+                        "interval": HEARTBEAT_SECONDS,
+                    }
+                )
+                + ")"
+            ),
+        ]
+        # A room that already shows its current code needs no render per join.
+        if linked_doc._code != linked_doc._rendered_code:
+            events.append(DocumentState.render_diagram)
+        return events
 
     @rx.event
     def copy_link(self):
@@ -980,4 +1011,23 @@ User ||--o{ Post : writes
         from codoc_in_plantuml.states.document_state import DocumentState
 
         doc = await self.get_state(DocumentState)
-        doc.delete_edge(edge_id)
\ No newline at end of file
+        doc.delete_edge(edge_id)
+
+
+def snippets_by_category() -> dict[str, list[str]]:
+    """Code of every built-in snippet, grouped by sidebar category."""
+    categories: list[Category] = EditorState.get_fields()[
+        "snippet_categories"
+    ].default_value()
+    sources: dict[str, list[str]] = {}
+    for category in categories:
+        codes = sources.setdefault(category.name, [])
+        codes.extend(snippet.code for snippet in category.snippets)
+        for subcategory in category.subcategories:
+            codes.extend(snippet.code for snippet in subcategory.snippets)
+    return sources
+
+
+def snippet_sources() -> list[str]:
+    """Code of every built-in snippet, e.g. to warm the render cache."""
+    return [code for codes in snippets_by_category().values() for code in codes]
@@ -1,40 +1,17 @@
 import reflex as rx
-import zlib
 import base64
-import logging
 from typing import TypedDict, Optional, Any
 import time
 import random
 import string
+from codoc_in_plantuml.utils import encoding
+from codoc_in_plantuml.utils.diagram_types import classify
+from codoc_in_plantuml.utils.graph import VisualGraph
 
 
 def plantuml_encode(text: str) -> str:
     """Encode PlantUML source to URL-safe format for the public server."""
-    if not text:
-        return ""
-    plantuml_alphabet = (
-        "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz-_"
-    )
-    standard_alphabet = (
-        "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
-    )
-    try:
-        compressed = zlib.compress(text.encode("utf-8"), 9)[2:-4]
-    except Exception as e:
-        logging.exception(f"Error compressing PlantUML text: {e}")
-        return ""
-    encoded = base64.b64encode(compressed).decode("ascii")
-    result = ""
-    for char in encoded:
-        if char == "=":
-            continue
-        try:
-            idx = standard_alphabet.index(char)
-            result += plantuml_alphabet[idx]
-        except ValueError as e:
-            logging.exception(f"Error mapping character during PlantUML encoding: {e}")
-            continue
-    return result
+    return encoding.encode(text)
 
 
 class VisualNode(TypedDict):
@@ -54,8 +31,10 @@ class VisualConnection(TypedDict):
 
 class PlantUMLState(rx.State):
     visual_mode: bool = False
-    visual_nodes: list[VisualNode] = []
-    visual_connections: list[VisualConnection] = []
+    # Nodes and connections by id; the counters say which side changed.
+    _graph: VisualGraph = VisualGraph(source_key="from_id", target_key="to_id")
+    _node_changes: int = 0
+    _connection_changes: int = 0
     mouse_x: int = 0
     mouse_y: int = 0
     connection_start_node_id: str | None = None
@@ -145,35 +124,27 @@ Object03 *-- Object01
 @enduml""",
     }
 
+    @rx.var(deps=["_node_changes"], auto_deps=False)
+    def visual_nodes(self) -> list[VisualNode]:
+        return self._graph.node_list()
+
+    @rx.var(deps=["_connection_changes"], auto_deps=False)
+    def visual_connections(self) -> list[VisualConnection]:
+        return self._graph.edge_list()
+
     @rx.var
     def encoded_url(self) -> str:
         """Computed var that returns the full URL for the image."""
         if not self.code:
             return ""
         encoded = plantuml_encode(self.code)
-        return f"http://www.plantuml.com/plantuml/svg/{encoded}"
+        format = classify(self.code).format
+        return f"http://www.plantuml.com/plantuml/{format}/{encoded}"
 
     @rx.var
     def detected_type(self) -> str:
-        """Simple heuristic to detect diagram type."""
-        code_lower = self.code.lower()
-        if "class " in code_lower:
-            return "Class"
-        elif (
-            "actor " in code_lower or "participant " in code_lower or "->" in code_lower
-        ):
-            return "Sequence"
-        elif "usecase " in code_lower:
-            return "Use Case"
-        elif "start" in code_lower and "stop" in code_lower:
-            return "Activity"
-        elif "package " in code_lower or "node " in code_lower:
-            return "Component"
-        elif "[*]" in code_lower:
-            return "State"
-        elif "object " in code_lower:
-            return "Object"
-        return "Unknown"
+        """Diagram type from the shared classifier."""
+        return classify(self.code).type
 
     sidebar_open: bool = False
     is_confirming_clear: bool = False
@@ -240,8 +211,9 @@ Object03 *-- Object01
         self.code = """@startuml
 
 @enduml"""
-        self.visual_nodes = []
-        self.visual_connections = []
+        self._graph = VisualGraph(source_key="from_id", target_key="to_id")
+        self._node_changes += 1
+        self._connection_changes += 1
         self.is_confirming_clear = False
 
     @rx.event
@@ -257,14 +229,11 @@ Object03 *-- Object01
     def handle_canvas_drop(self, item: dict[str, Any]):
         """Handle dropping a node onto the canvas."""
         if "id" in item and (not item.get("is_new", False)):
-            node_id = item["id"]
-            new_nodes = []
-            for node in self.visual_nodes:
-                if node["id"] == node_id:
-                    node["x"] = max(0, self.mouse_x - 60)
-                    node["y"] = max(0, self.mouse_y - 40)
-                new_nodes.append(node)
-            self.visual_nodes = new_nodes
+            self._graph.update_node(
+                item["id"],
+                x=max(0, self.mouse_x - 60),
+                y=max(0, self.mouse_y - 40),
+            )
         elif "type" in item:
             unique_id = "".join(random.choices(string.ascii_lowercase, k=6))
             new_node: VisualNode = {
@@ -274,7 +243,8 @@ Object03 *-- Object01
                 "x": max(0, self.mouse_x - 60),
                 "y": max(0, self.mouse_y - 40),
             }
-            self.visual_nodes.append(new_node)
+            self._graph.add_node(new_node)
+        self._node_changes += 1
         self.regenerate_code_from_visual()
 
     @rx.event
@@ -284,53 +254,44 @@ Object03 *-- Object01
             self.connection_start_node_id = node_id
             yield rx.toast("Select another node to connect")
         else:
-            if self.connection_start_node_id != node_id:
-                exists = False
-                for conn in self.visual_connections:
-                    if (
-                        conn["from_id"] == self.connection_start_node_id
-                        and conn["to_id"] == node_id
-                    ):
-                        exists = True
-                        break
-                if not exists:
-                    conn_id = "".join(random.choices(string.ascii_lowercase, k=6))
-                    new_conn: VisualConnection = {
-                        "id": conn_id,
-                        "from_id": self.connection_start_node_id,
-                        "to_id": node_id,
-                        "label": "",
-                    }
-                    self.visual_connections.append(new_conn)
+            if self.connection_start_node_id != node_id and not self._graph.has_edge(
+                self.connection_start_node_id, node_id
+            ):
+                conn_id = "".join(random.choices(string.ascii_lowercase, k=6))
+                new_conn: VisualConnection = {
+                    "id": conn_id,
+                    "from_id": self.connection_start_node_id,
+                    "to_id": node_id,
+                    "label": "",
+                }
+                if self._graph.add_edge(new_conn):
+                    self._connection_changes += 1
                     self.regenerate_code_from_visual()
             self.connection_start_node_id = None
 
     @rx.event
     def delete_node(self, node_id: str):
         """Delete a node and its connections."""
-        self.visual_nodes = [n for n in self.visual_nodes if n["id"] != node_id]
-        self.visual_connections = [
-            c
-            for c in self.visual_connections
-            if c["from_id"] != node_id and c["to_id"] != node_id
-        ]
+        graph = self._graph
+        had_connections = node_id in graph.outgoing or node_id in graph.incoming
+        if not graph.remove_node(node_id):
+            return
+        self._node_changes += 1
+        if had_connections:
+            self._connection_changes += 1
         self.regenerate_code_from_visual()
 
     @rx.event
     def update_node_label(self, node_id: str, new_label: str):
-        new_nodes = []
-        for node in self.visual_nodes:
-            if node["id"] == node_id:
-                node["label"] = new_label
-            new_nodes.append(node)
-        self.visual_nodes = new_nodes
-        self.regenerate_code_from_visual()
+        if self._graph.update_node(node_id, label=new_label):
+            self._node_changes += 1
+            self.regenerate_code_from_visual()
 
     @rx.event
     def regenerate_code_from_visual(self):
         """Generate PlantUML code from visual state."""
         lines = ["@startuml"]
-        for node in self.visual_nodes:
+        for node in self._graph.nodes.values():
             safe_label = node["label"].replace('"', "")
             node_type = node["type"]
             if node_type == "actor":
@@ -346,7 +307,7 @@ Object03 *-- Object01
             else:
                 lines.append(f'''rectangle "{safe_label}" as {node["id"]}''')
         lines.append("")
-        for conn in self.visual_connections:
+        for conn in self._graph.edges.values():
             lines.append(f"{conn['from_id']} --> {conn['to_id']}")
         lines.append("@enduml")
         self.code = """
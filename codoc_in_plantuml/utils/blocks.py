@@ -0,0 +1,147 @@
+import re
+from codoc_in_plantuml.utils.diagram_types import classify
+
+_START_RE = re.compile(r"^\s*@start(\w+)", re.IGNORECASE)
+_END_RE = re.compile(r"^\s*@end\w*", re.IGNORECASE)
+_END_KIND_RE = re.compile(r"^\s*@end(\w*)", re.IGNORECASE)
+# Block kinds whose bodies use braces structurally (class bodies, packages,
+# skinparam groups, JSON objects).
+_BRACE_KINDS = {"uml", "json"}
+_QUOTED_RE = re.compile(r'"(?:[^"\\]|\\.)*"')
+# Arrow tokens, including crow's-foot ends like ``||--o{`` and ``}o..|{``.
+_ARROW_RE = re.compile(r"\S*(?:--|\.\.|->|<-)\S*")
+# Free text in UML blocks, where braces are just characters: lines that are
+# all text (titles, captions) and multi-line note/legend/title bodies, which
+# run until their ``end`` line. A note with a ``:`` or a quoted text is a
+# single line.
+_TEXT_LINE_RE = re.compile(r"(?:title|header|footer|caption)\b", re.IGNORECASE)
+_TEXT_BLOCK_RE = re.compile(
+    r"(?:[rh]?note\b[^:\"]*|legend\b.*|(?:title|header|footer)\s*)$",
+    re.IGNORECASE,
+)
+_TEXT_BLOCK_END_RE = re.compile(
+    r"end\s*(?:[rh]?note|legend|title|header|footer)\b", re.IGNORECASE
+)
+
+
+def split_blocks(text: str) -> list[str]:
+    """Split PlantUML text into its ``@start...@end`` blocks.
+
+    Unterminated blocks are closed with the matching ``@end`` directive and
+    text without any ``@start`` line is wrapped as a single ``@startuml`` block,
+    so every returned block can be fed to PlantUML's pipe mode on its own.
+    """
+    blocks: list[str] = []
+    current: list[str] | None = None
+    kind = "uml"
+    for line in text.splitlines():
+        if current is None:
+            match = _START_RE.match(line)
+            if match:
+                kind = match.group(1).lower()
+                current = [line]
+            continue
+        current.append(line)
+        if _END_RE.match(line):
+            blocks.append("\n".join(current))
+            current = None
+    if current is not None:
+        current.append(f"@end{kind}")
+        blocks.append("\n".join(current))
+    if not blocks and text.strip():
+        blocks.append(f"@startuml\n{text.strip()}\n@enduml")
+    return blocks
+
+
+def block_format(block: str) -> str:
+    """Output format for a block: ditaa only renders to PNG."""
+    return classify(block).format
+
+
+def _brace_error(lines: list[tuple[int, str]], kind: str = "uml") -> str | None:
+    open_lines: list[int] = []
+    in_comment = False
+    in_text = False
+    for number, line in lines:
+        stripped = line.strip()
+        if in_comment:
+            in_comment = not stripped.endswith("'/")
+            continue
+        if stripped.startswith("/'"):
+            in_comment = not stripped.endswith("'/")
+            continue
+        if stripped.startswith("'"):
+            continue
+        # Braces inside quoted labels, JSON strings or arrow heads are not
+        # structure.
+        code = _ARROW_RE.sub("", _QUOTED_RE.sub("", stripped))
+        if kind != "json":
+            # Nor are those in messages, descriptions and notes.
+            if in_text:
+                in_text = not _TEXT_BLOCK_END_RE.match(stripped)
+                continue
+            if _TEXT_BLOCK_RE.match(stripped):
+                in_text = True
+                continue
+            if _TEXT_LINE_RE.match(stripped):
+                continue
+            code = code.split(":", 1)[0]
+        for char in code:
+            if char == "{":
+                open_lines.append(number)
+            elif char == "}":
+                if not open_lines:
+                    return f"Line {number}: '}}' without a matching '{{'"
+                open_lines.pop()
+    if open_lines:
+        return f"Line {open_lines[-1]}: '{{' is not closed"
+    return None
+
+
+def find_syntax_error(text: str) -> str | None:
+    """Cheap structural check run before sending text to the renderer.
+
+    Catches what makes most in-progress edits unrenderable: ``@start`` and
+    ``@end`` lines that are missing, mismatched or nested, and unbalanced
+    block braces. Returns a message naming the line, or ``None`` if the
+    text looks renderable. This is not a PlantUML parser; anything it lets
+    through is still checked by the renderer.
+    """
+    open_kind: str | None = None
+    open_line = 0
+    body: list[tuple[int, str]] = []
+    seen_start = False
+    for number, line in enumerate(text.splitlines(), start=1):
+        start = _START_RE.match(line)
+        end = _END_KIND_RE.match(line)
+        if start:
+            if open_kind is not None:
+                return (
+                    f"Line {number}: @start{start.group(1)} before "
+                    f"@end{open_kind} closes line {open_line}"
+                )
+            open_kind, open_line, body = start.group(1).lower(), number, []
+            seen_start = True
+        elif end:
+            kind = end.group(1).lower()
+            if open_kind is None:
+                return f"Line {number}: @end{kind} without a matching @start"
+            if kind and kind != open_kind:
+                return (
+                    f"Line {number}: @end{kind} does not match "
+                    f"@start{open_kind} on line {open_line}"
+                )
+            if open_kind in _BRACE_KINDS:
+                error = _brace_error(body, open_kind)
+                if error:
+                    return error
+            open_kind = None
+        elif open_kind is not None:
+            body.append((number, line))
+        elif not seen_start:
+            body.append((number, line))
+    if open_kind is not None:
+        return f"Line {open_line}: @start{open_kind} is not closed with @end{open_kind}"
+    if not seen_start:
+        return _brace_error(body)
+    return None
@@ -0,0 +1,257 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class DiagramKind:
+    type: str
+    # Output format to request: ditaa only renders to PNG.
+    format: str = "svg"
+
+
+UNKNOWN = DiagramKind("Unknown")
+
+_DIRECTIVE_RE = re.compile(r"^[ \t]*@start(\w+)", re.IGNORECASE | re.MULTILINE)
+# Anchored on the newline rather than ``^`` so the engine can jump between
+# candidates; the line before an ``@end`` always ends in one.
+_END_RE = re.compile(r"\n[ \t]*@end", re.IGNORECASE)
+
+# Directives that name the diagram type on their own.
+_DIRECTIVES = {
+    "json": DiagramKind("JSON"),
+    "yaml": DiagramKind("YAML"),
+    "ebnf": DiagramKind("EBNF"),
+    "regex": DiagramKind("Regex"),
+    "nwdiag": DiagramKind("Network"),
+    "salt": DiagramKind("Salt"),
+    "gantt": DiagramKind("Gantt"),
+    "chronology": DiagramKind("Chronology"),
+    "mindmap": DiagramKind("MindMap"),
+    "wbs": DiagramKind("WBS"),
+    "math": DiagramKind("Math"),
+    "latex": DiagramKind("Math"),
+    "ditaa": DiagramKind("Ditaa", "png"),
+    "dot": DiagramKind("Graphviz"),
+    "chen": DiagramKind("ER"),
+    "files": DiagramKind("Files"),
+    "board": DiagramKind("Board"),
+    "creole": DiagramKind("Creole"),
+}
+
+# ``@startuml`` bodies, most specific type first: the first type in this
+# order with a marker in the body wins. Most markers are the leading word of
+# a line; a few can appear anywhere on one.
+_TYPE_ORDER = [
+    "Archimate",
+    "Timing",
+    "ER",
+    "State",
+    "Activity",
+    "Use Case",
+    "Object",
+    "Class",
+    "Sequence",
+    "Deployment",
+    "Component",
+]
+_PRIORITY = {type: rank for rank, type in enumerate(_TYPE_ORDER)}
+_KEYWORDS = {
+    "archimate": "Archimate",
+    **dict.fromkeys(("robust", "concise", "clock", "binary", "analog"), "Timing"),
+    "state": "State",
+    **dict.fromkeys(("endif", "endwhile", "repeat", "fork"), "Activity"),
+    "usecase": "Use Case",
+    **dict.fromkeys(("object", "map"), "Object"),
+    **dict.fromkeys(("class", "interface", "enum", "annotation", "abstract"), "Class"),
+    **dict.fromkeys(
+        (
+            "participant",
+            "boundary",
+            "control",
+            "collections",
+            "queue",
+            "activate",
+            "deactivate",
+            "autonumber",
+            "alt",
+            "loop",
+            "par",
+            "opt",
+            "critical",
+            "return",
+        ),
+        "Sequence",
+    ),
+    **dict.fromkeys(
+        ("node", "cloud", "artifact", "frame", "folder", "storage", "stack"),
+        "Deployment",
+    ),
+    **dict.fromkeys(("component", "package"), "Component"),
+    "(": "Use Case",
+    "[": "Component",
+}
+_CONTEXT_TOKENS = {
+    "entity",
+    "start",
+    "stop",
+    "kill",
+    "detach",
+    "if",
+    "elseif",
+    "while",
+    "note",
+    "skinparam",
+    ":",
+    "|",
+}
+# Shared by several types; they only decide when no other marker does.
+_WEAK_KEYWORDS = {"actor": "Sequence", "database": "Component"}
+_LINE_WORDS = sorted(
+    (set(_KEYWORDS) | _CONTEXT_TOKENS | set(_WEAK_KEYWORDS)) - set(":|(["),
+    key=len,
+    reverse=True,
+)
+# Lines that start with a marker, in the lowercased body with a newline
+# prepended. The literal newline prefix lets the regex engine skip straight
+# from line to line instead of trying the pattern at every character.
+_LINE_RE = re.compile(
+    r"\n[ \t]*(?:(" + "|".join(_LINE_WORDS) + r")\b|([:|(\[]))"
+)
+_ER_ARROW_RE = re.compile(r"[|}][|o]--?[o|][|{]")
+# Every crow's-foot arrow contains one of these; cheap to rule out first.
+_ER_ARROW_ENDS = ("||", "}o", "}|", "o{", "|{")
+_CLASS_ARROWS = ("<|--", "--|>", "<|..", "..|>", "*--", "--*")
+_AGGREGATION_RE = re.compile(r"\bo--|--o\b")
+
+
+def _line_type(token: str, line: str) -> str | None:
+    """Type marked by a line that starts with ``token``, where that depends
+    on the rest of the line."""
+    if token == "entity":
+        return "ER" if "{" in line else "Sequence"
+    if token in ("start", "stop", "kill", "detach"):
+        return "Activity" if line.strip() == token else None
+    if token in ("if", "elseif", "while"):
+        rest = line.lstrip()[len(token) :].lstrip()
+        return "Activity" if rest.startswith("(") else None
+    if token == ":":
+        return "Activity" if line.rstrip().endswith(";") else None
+    if token == "|":
+        stripped = line.strip()
+        return "Activity" if len(stripped) > 2 and stripped.endswith("|") else None
+    if token in ("note", "skinparam"):
+        words = line.split()
+        if len(words) > 1 and (words[1] == "over" or words[1].startswith("sequence")):
+            return "Sequence"
+    return None
+
+
+def _classify_uml(body: str) -> DiagramKind:
+    text = "\n" + body.lower()
+    best = len(_TYPE_ORDER)
+    # Markers that can appear anywhere on a line, checked most specific first.
+    # Most of them need a '|' or '*', which are rare in other diagrams and
+    # cheap to look for, so those scans are usually skipped.
+    bar, star = "|" in text, "*" in text
+    if (
+        (bar or "}" in text)
+        and any(end in text for end in _ER_ARROW_ENDS)
+        and _ER_ARROW_RE.search(text)
+    ):
+        best = _PRIORITY["ER"]
+    elif star and "[*]" in text:
+        best = _PRIORITY["State"]
+    elif ((bar or star) and any(arrow in text for arrow in _CLASS_ARROWS)) or (
+        ("o--" in text or "--o" in text) and _AGGREGATION_RE.search(text)
+    ):
+        best = _PRIORITY["Class"]
+    weak = None
+    for match in _LINE_RE.finditer(text):
+        if best == 0:
+            break
+        token = match.group(1) or match.group(2)
+        if token in _CONTEXT_TOKENS:
+            end = text.find("\n", match.end())
+            type = _line_type(token, text[match.start() + 1 : end if end >= 0 else None])
+        elif token in _WEAK_KEYWORDS:
+            weak = weak or _WEAK_KEYWORDS[token]
+            continue
+        else:
+            type = _KEYWORDS[token]
+        if type is not None and _PRIORITY[type] < best:
+            best = _PRIORITY[type]
+    if best < len(_TYPE_ORDER):
+        return DiagramKind(_TYPE_ORDER[best])
+    if "->" in text:
+        return DiagramKind("Sequence")
+    return DiagramKind(weak) if weak else UNKNOWN
+
+
+_CACHE_SIZE = 256
+_cache: OrderedDict[bytes, DiagramKind] = OrderedDict()
+_cache_lock = threading.Lock()
+# Only this much of the first block is scanned. Diagrams declare what they
+# are near the top, and it keeps the cost of an edit flat however long the
+# document grows; edits below the head hit the cache.
+_HEAD_CHARS = 16 * 1024
+
+
+def _head(code: str) -> tuple[str | None, str]:
+    """The ``@start`` directive of the first block and the head of its body."""
+    directive = _DIRECTIVE_RE.search(code, 0, _HEAD_CHARS)
+    if directive is None:
+        name, start = None, 0
+    else:
+        name, start = directive.group(1).lower(), directive.end()
+        if name != "uml":
+            return name, ""
+    limit = start + _HEAD_CHARS
+    end = _END_RE.search(code, start, limit)
+    if end is not None:
+        return name, code[start : end.start()]
+    if len(code) <= limit:
+        return name, code[start:]
+    # Cut at a line end, so no marker is judged on half a line.
+    cut = code.rfind("\n", start, limit)
+    return name, code[start : cut if cut > start else limit]
+
+
+def _classify_head(name: str | None, body: str) -> DiagramKind:
+    if name is None:
+        return _classify_uml(body) if body.strip() else UNKNOWN
+    if name != "uml":
+        return _DIRECTIVES.get(name, DiagramKind(name.title()))
+    return _classify_uml(body)
+
+
+def _classify(code: str) -> DiagramKind:
+    return _classify_head(*_head(code))
+
+
+def classify(code: str) -> DiagramKind:
+    """Diagram type and output format of ``code``, from its first block.
+
+    The ``@start`` directive decides where it names the type; otherwise the
+    first ``_HEAD_CHARS`` of the ``@startuml`` body are scanned once for the
+    markers of each diagram type. Results are cached by a hash of that head.
+    """
+    name, body = _head(code)
+    if name is not None and name != "uml":
+        return _classify_head(name, body)
+    key = hashlib.blake2b(
+        f"{name}\0{body}".encode("utf-8", "surrogatepass"), digest_size=16
+    ).digest()
+    with _cache_lock:
+        kind = _cache.get(key)
+        if kind is not None:
+            _cache.move_to_end(key)
+            return kind
+    kind = _classify_head(name, body)
+    with _cache_lock:
+        _cache[key] = kind
+        if len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return kind
@@ -0,0 +1,384 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from codoc_in_plantuml.utils.text_ops import TextOperation
+from codoc_in_plantuml.utils.version_history import (
+    HISTORY_SCHEMA,
+    VersionHistory,
+    content_hash,
+)
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    room TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    code TEXT,
+    nodes TEXT NOT NULL DEFAULT '[]',
+    edges TEXT NOT NULL DEFAULT '[]',
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS edits (
+    room TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    ops TEXT NOT NULL,
+    PRIMARY KEY (room, version)
+) WITHOUT ROWID;
+"""
+
+# Writes are grouped into one transaction of up to this many records.
+_BATCH_SIZE = 1000
+
+
+@dataclass
+class StoredDocument:
+    version: int
+    code: str
+    nodes: list[dict[str, str]] = field(default_factory=list)
+    edges: list[dict[str, str]] = field(default_factory=list)
+
+
+class DocumentStore:
+    """Write-behind SQLite store for room documents.
+
+    Each applied edit batch is appended to an ``edits`` log; every
+    ``snapshot_every`` versions the whole document is written to
+    ``documents`` and the log up to it is dropped. A room is recovered by
+    replaying its log on top of its last snapshot.
+
+    Every edit also becomes a revision in the room's version history (see
+    ``version_history``), which is kept in full.
+
+    Callers only enqueue records; a single writer thread commits them in
+    batches, so the edit path never waits on the disk. Reads do not wait
+    for it either: they merge the room's still queued records over what is
+    committed. Records still queued when the process dies are lost, which
+    costs at most the last few edits.
+    """
+
+    def __init__(
+        self, path: Path, snapshot_every: int = 100, history_deltas: int = 128
+    ):
+        self.path = path
+        self.snapshot_every = snapshot_every
+        self.history = VersionHistory(max_deltas=history_deltas)
+        self.writes = 0
+        self.errors = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._writer: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._closed = False
+        # The writer thread's connection.
+        self._db: sqlite3.Connection | None = None
+        # room -> its records queued but not yet committed, oldest first.
+        self._pending: dict[str, deque[tuple]] = {}
+
+    def append_edit(self, room: str, version: int, ops: list, code: str) -> None:
+        """Log the edit that took ``room`` to ``version``, producing ``code``."""
+        self._put(("edit", room, version, ops, code))
+
+    def save_snapshot(self, room: str, version: int, code: str) -> None:
+        self._put(("snapshot", room, version, code))
+
+    def save_graph(
+        self, room: str, nodes: list[dict[str, str]], edges: list[dict[str, str]]
+    ) -> None:
+        self._put(("graph", room, nodes, edges))
+
+    def load(self, room: str, base_code: str) -> StoredDocument | None:
+        """The stored document for ``room``, or None if it was never saved.
+
+        ``base_code`` is the text edits were made against when the room has
+        a log but no snapshot of its code yet. Reads the database; call it
+        off the event loop.
+        """
+        pending = self._pending_records(room)
+        try:
+            with self._connect() as db:
+                row = db.execute(
+                    "SELECT version, code, nodes, edges FROM documents WHERE room = ?",
+                    (room,),
+                ).fetchone()
+                edits = db.execute(
+                    "SELECT version, ops FROM edits WHERE room = ? AND version > ? "
+                    "ORDER BY version",
+                    (room, row[0] if row else 0),
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning("Could not load document %s: %s", room, e)
+            return None
+        if row is None and not edits and not pending:
+            return None
+        if row is None:
+            document = StoredDocument(version=0, code=base_code)
+        else:
+            version, code, nodes, edges = row
+            document = StoredDocument(
+                version=version,
+                code=base_code if code is None else code,
+                nodes=json.loads(nodes),
+                edges=json.loads(edges),
+            )
+        for version, ops in edits:
+            if version != document.version + 1:
+                logger.warning("Edit log for %s has a gap at %d", room, version)
+                break
+            try:
+                document.code = TextOperation.from_json(json.loads(ops)).apply(
+                    document.code
+                )
+            except ValueError as e:
+                logger.warning("Stopped replaying %s at %d: %s", room, version, e)
+                break
+            document.version = version
+        # Records committed since they were copied are already applied above.
+        for record in pending:
+            kind = record[0]
+            if kind == "edit" and record[2] == document.version + 1:
+                document.version, document.code = record[2], record[4]
+            elif kind == "snapshot" and record[2] >= document.version:
+                document.version, document.code = record[2], record[3]
+            elif kind == "graph":
+                document.nodes, document.edges = record[2], record[3]
+        return document
+
+    def versions(
+        self, room: str, limit: int = 100, before: int | None = None
+    ) -> list[dict]:
+        """Revisions of ``room``, newest first. Reads like ``load``."""
+        pending = [
+            record
+            for record in reversed(self._pending_records(room))
+            if record[0] == "edit" and (before is None or record[2] < before)
+        ][:limit]
+        try:
+            with self._connect() as db:
+                stored = self.history.versions(db, room, limit, before)
+        except sqlite3.Error as e:
+            logger.warning("Could not list versions of %s: %s", room, e)
+            stored = []
+        # Queued revisions get their timestamp when they are committed.
+        now = time.time()
+        versions = {
+            record[2]: {
+                "version": record[2],
+                "created": now,
+                "hash": content_hash(record[4]).hex(),
+            }
+            for record in pending
+        }
+        versions.update((entry["version"], entry) for entry in stored)
+        return sorted(versions.values(), key=lambda v: v["version"], reverse=True)[
+            :limit
+        ]
+
+    def load_version(self, room: str, version: int) -> str | None:
+        """The text of ``room`` at ``version``, or None if it is not stored."""
+        for record in self._pending_records(room):
+            if record[0] == "edit" and record[2] == version:
+                return record[4]
+        try:
+            with self._connect() as db:
+                return self.history.load(db, room, version)
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning("Could not load %s at %d: %s", room, version, e)
+            return None
+
+    def flush(self) -> None:
+        """Wait until every record queued so far is committed."""
+        if self._writer is not None:
+            self._queue.join()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            writer = self._writer
+        if writer is not None:
+            self._queue.put(None)
+            writer.join()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "queued": self._queue.qsize(),
+            "writes": self.writes,
+            "errors": self.errors,
+        }
+
+    def _put(self, record: tuple) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            if self._writer is None:
+                self._writer = threading.Thread(
+                    target=self._run, name="document-store", daemon=True
+                )
+                self._writer.start()
+            self._pending.setdefault(record[1], deque()).append(record)
+            # Queued under the lock, so nothing lands behind close()'s None.
+            self._queue.put(record)
+
+    def _pending_records(self, room: str) -> list[tuple]:
+        with self._lock:
+            return list(self._pending.get(room, ()))
+
+    def _connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=30)
+        # SQLite's own write-ahead log keeps commits cheap and lets loads
+        # read while the writer commits.
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(_SCHEMA)
+        db.executescript(HISTORY_SCHEMA)
+        return db
+
+    def _run(self) -> None:
+        while True:
+            records = [self._queue.get()]
+            while len(records) < _BATCH_SIZE:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in records
+            batch = [r for r in records if r is not None]
+            # Any exception is caught: if this thread died, nothing queued
+            # after it would ever be written and flush() would never return.
+            try:
+                self._commit(batch)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(
+                    "Could not persist %d document records: %s", len(batch), e
+                )
+                if len(batch) > 1:
+                    # Keep one bad record from costing every room its writes.
+                    self._commit_each(batch)
+            finally:
+                with self._lock:
+                    for record in batch:
+                        pending = self._pending[record[1]]
+                        pending.popleft()
+                        if not pending:
+                            del self._pending[record[1]]
+                for _ in records:
+                    self._queue.task_done()
+            if stop:
+                if self._db is not None:
+                    self._db.close()
+                return
+
+    def _commit(self, records: list[tuple]) -> None:
+        """Write ``records`` in one transaction, all or nothing."""
+        if self._db is None:
+            self._db = self._connect()
+        try:
+            with self._db:
+                self._write(self._db, records)
+        except Exception as e:
+            # The rolled back revisions can no longer be delta bases.
+            self.history.reset()
+            if isinstance(e, (sqlite3.Error, OSError)):
+                self._db.close()
+                self._db = None
+            raise
+        self.writes += len(records)
+
+    def _commit_each(self, records: list[tuple]) -> None:
+        """Commit ``records`` one at a time, dropping the ones that fail."""
+        for record in records:
+            try:
+                if self._db is None:
+                    self._db = self._connect()
+            except (sqlite3.Error, OSError) as e:
+                self.errors += 1
+                logger.warning("Dropped %d document records: %s", len(records), e)
+                return
+            try:
+                self._commit([record])
+            except Exception as e:
+                self.errors += 1
+                logger.warning("Dropped %s record of %s: %s", record[0], record[1], e)
+
+    def _write(self, db: sqlite3.Connection, records: list[tuple]) -> None:
+        now = time.time()
+        edits = []
+        # Only the newest snapshot and graph of each room in a batch matter.
+        snapshots: dict[str, tuple] = {}
+        graphs: dict[str, tuple] = {}
+        for record in records:
+            kind, room = record[0], record[1]
+            if kind == "edit":
+                edits.append((room, record[2], json.dumps(record[3])))
+                self.history.record(db, room, record[2], record[4], record[3], now)
+            elif kind == "snapshot":
+                snapshots[room] = (room, record[2], record[3], now)
+            else:
+                graphs[room] = (room, json.dumps(record[2]), json.dumps(record[3]), now)
+        db.executemany("INSERT OR REPLACE INTO edits VALUES (?, ?, ?)", edits)
+        db.executemany(
+            "INSERT INTO documents (room, version, code, updated) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (room) DO UPDATE SET version = excluded.version, "
+            "code = excluded.code, updated = excluded.updated "
+            "WHERE excluded.version >= documents.version",
+            snapshots.values(),
+        )
+        # Compact: the log up to a snapshot is no longer needed.
+        db.executemany(
+            "DELETE FROM edits WHERE room = ? AND version <= ?",
+            [(room, version) for room, version, _, _ in snapshots.values()],
+        )
+        db.executemany(
+            "INSERT INTO documents (room, version, nodes, edges, updated) "
+            "VALUES (?, 0, ?, ?, ?) "
+            "ON CONFLICT (room) DO UPDATE SET nodes = excluded.nodes, "
+            "edges = excluded.edges, updated = excluded.updated",
+            graphs.values(),
+        )
+
+
+_store: DocumentStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_document_store() -> DocumentStore | None:
+    """Return the process-wide document store, or None when disabled."""
+    global _store
+    if os.getenv("CODOC_PLANTUML_PERSIST", "1").lower() in {"0", "false", "no"}:
+        return None
+    with _store_lock:
+        if _store is None:
+            repo_root = Path(__file__).resolve().parents[2]
+            path = Path(
+                os.getenv(
+                    "CODOC_PLANTUML_DOCUMENT_DB",
+                    str(repo_root / ".cache" / "documents.sqlite3"),
+                )
+            )
+            try:
+                snapshot_every = max(
+                    1, int(os.getenv("CODOC_PLANTUML_SNAPSHOT_EVERY", ""))
+                )
+            except ValueError:
+                snapshot_every = 100
+            try:
+                history_deltas = max(
+                    0, int(os.getenv("CODOC_PLANTUML_HISTORY_DELTAS", ""))
+                )
+            except ValueError:
+                history_deltas = 128
+            _store = DocumentStore(
+                path, snapshot_every=snapshot_every, history_deltas=history_deltas
+            )
+        return _store
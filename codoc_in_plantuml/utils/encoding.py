@@ -0,0 +1,40 @@
+import base64
+import zlib
+
+# PlantUML's URL alphabet is base64 with a different symbol order. Padding
+# maps to the zero symbol, which is what PlantUML emits for a short last group.
+_STANDARD_ALPHABET = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+_PLANTUML_ALPHABET = b"0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz-_"
+_ENCODE_TABLE = bytes.maketrans(_STANDARD_ALPHABET + b"=", _PLANTUML_ALPHABET + b"0")
+_DECODE_TABLE = bytes.maketrans(_PLANTUML_ALPHABET, _STANDARD_ALPHABET)
+
+
+def _compression_level(size: int) -> int:
+    # Maximum compression keeps URLs short for typical diagrams, but level 9
+    # gets expensive on very large sources that are re-encoded per keystroke.
+    if size <= 64 * 1024:
+        return 9
+    if size <= 512 * 1024:
+        return 6
+    return 1
+
+
+def encode(text: str) -> str:
+    """Deflate ``text`` and encode it with PlantUML's URL alphabet."""
+    if not text:
+        return ""
+    data = text.encode("utf-8")
+    compressor = zlib.compressobj(_compression_level(len(data)), zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush()
+    return base64.b64encode(compressed).translate(_ENCODE_TABLE).decode("ascii")
+
+
+def decode(encoded: str) -> str:
+    """Inverse of ``encode``."""
+    if not encoded:
+        return ""
+    data = encoded.encode("ascii").translate(_DECODE_TABLE)
+    data += b"=" * (-len(data) % 4)
+    # Zero-symbol padding decodes to trailing zero bytes, which raw inflate
+    # ignores once the final deflate block has been read.
+    return zlib.decompressobj(-15).decompress(base64.b64decode(data)).decode("utf-8")
@@ -0,0 +1,103 @@
+from typing import Any
+
+
+class VisualGraph:
+    """Nodes and edges of a visual editor, indexed by id.
+
+    ``outgoing`` and ``incoming`` map a node id to the ids of its edges and
+    ``pairs`` maps ``(source, target)`` to the edge connecting them, so
+    adding, relabelling and deleting touch only the node and its own edges.
+    ``nodes`` and ``edges`` keep insertion order, which is the order the UI
+    lists them in.
+
+    Node and edge dicts are replaced rather than changed in place, so the
+    lists from ``node_list`` and ``edge_list`` stay valid while another
+    thread (the document store's writer) reads them.
+
+    This is deliberately not a dataclass: Reflex would wrap it in a change
+    tracking proxy whose bookkeeping on every nested access costs more than
+    the edits themselves. States holding a graph mark their own changes.
+    """
+
+    def __init__(self, source_key: str = "source", target_key: str = "target"):
+        self.source_key = source_key
+        self.target_key = target_key
+        self.nodes: dict[str, dict[str, Any]] = {}
+        self.edges: dict[str, dict[str, Any]] = {}
+        self.outgoing: dict[str, set[str]] = {}
+        self.incoming: dict[str, set[str]] = {}
+        self.pairs: dict[tuple[str, str], str] = {}
+
+    @classmethod
+    def from_lists(
+        cls, nodes: list[dict[str, Any]], edges: list[dict[str, Any]], **keys: str
+    ) -> "VisualGraph":
+        """Index serialized lists; duplicate ids and connections are dropped."""
+        graph = cls(**keys)
+        for node in nodes:
+            graph.add_node(dict(node))
+        for edge in edges:
+            graph.add_edge(dict(edge))
+        return graph
+
+    def __len__(self) -> int:
+        return len(self.nodes) + len(self.edges)
+
+    def node_list(self) -> list[dict[str, Any]]:
+        return list(self.nodes.values())
+
+    def edge_list(self) -> list[dict[str, Any]]:
+        return list(self.edges.values())
+
+    def add_node(self, node: dict[str, Any]) -> bool:
+        if node["id"] in self.nodes:
+            return False
+        self.nodes[node["id"]] = node
+        return True
+
+    def update_node(self, node_id: str, **changes: Any) -> bool:
+        node = self.nodes.get(node_id)
+        if node is None:
+            return False
+        self.nodes[node_id] = {**node, **changes}
+        return True
+
+    def remove_node(self, node_id: str) -> bool:
+        """Remove a node and every edge to or from it."""
+        if self.nodes.pop(node_id, None) is None:
+            return False
+        for edge_id in [
+            *self.outgoing.pop(node_id, ()),
+            *self.incoming.pop(node_id, ()),
+        ]:
+            self.remove_edge(edge_id)
+        return True
+
+    def has_edge(self, source: str, target: str) -> bool:
+        return (source, target) in self.pairs
+
+    def add_edge(self, edge: dict[str, Any]) -> bool:
+        """Add ``edge``; False if its id is taken or its nodes are already
+        connected in that direction."""
+        source, target = edge[self.source_key], edge[self.target_key]
+        if (source, target) in self.pairs or edge["id"] in self.edges:
+            return False
+        self.edges[edge["id"]] = edge
+        self.pairs[(source, target)] = edge["id"]
+        self.outgoing.setdefault(source, set()).add(edge["id"])
+        self.incoming.setdefault(target, set()).add(edge["id"])
+        return True
+
+    def remove_edge(self, edge_id: str) -> bool:
+        edge = self.edges.pop(edge_id, None)
+        if edge is None:
+            return False
+        source, target = edge[self.source_key], edge[self.target_key]
+        del self.pairs[(source, target)]
+        for index, node_id in ((self.outgoing, source), (self.incoming, target)):
+            ids = index.get(node_id)
+            if ids is not None:
+                ids.discard(edge_id)
+                if not ids:
+                    del index[node_id]
+        return True
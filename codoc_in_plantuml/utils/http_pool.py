@@ -0,0 +1,104 @@
+import http.client
+import queue
+import threading
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+
+@dataclass
+class HTTPResult:
+    status: int
+    content_type: str
+    body: bytes
+    headers: dict[str, str] = field(default_factory=dict)
+
+
+class HTTPConnectionPool:
+    """Keep-alive connections to a single origin, shared across threads.
+
+    Up to ``size`` idle connections are kept for reuse. A request on a
+    connection the server has since closed is retried once on a fresh one.
+    """
+
+    def __init__(self, base_url: str, size: int = 4, timeout: float = 30.0):
+        parts = urlsplit(base_url)
+        if parts.scheme not in {"http", "https"} or not parts.hostname:
+            raise ValueError(f"Unsupported PlantUML server URL: {base_url}")
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path.rstrip("/")
+        self.timeout = timeout
+        self.requests = 0
+        self.connections = 0
+        self._idle: queue.LifoQueue[http.client.HTTPConnection] = queue.LifoQueue(
+            maxsize=size
+        )
+        self._lock = threading.Lock()
+
+    def _connect(self) -> http.client.HTTPConnection:
+        connection_class = (
+            http.client.HTTPSConnection
+            if self.scheme == "https"
+            else http.client.HTTPConnection
+        )
+        with self._lock:
+            self.connections += 1
+        return connection_class(self.host, self.port, timeout=self.timeout)
+
+    def _checkout(self) -> tuple[http.client.HTTPConnection, bool]:
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self._connect(), False
+
+    def _checkin(self, connection: http.client.HTTPConnection) -> None:
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        body: bytes | None = None,
+        headers: dict[str, str] | None = None,
+    ) -> HTTPResult:
+        with self._lock:
+            self.requests += 1
+        connection, reused = self._checkout()
+        while True:
+            try:
+                connection.request(
+                    method, self.base_path + path, body=body, headers=headers or {}
+                )
+                response = connection.getresponse()
+                result = HTTPResult(
+                    response.status,
+                    response.getheader("Content-Type", ""),
+                    response.read(),
+                    dict(response.getheaders()),
+                )
+            except (http.client.HTTPException, ConnectionError):
+                connection.close()
+                if not reused:
+                    raise
+                # The server dropped an idle keep-alive connection.
+                connection, reused = self._connect(), False
+                continue
+            except OSError:
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self._checkin(connection)
+            return result
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
@@ -0,0 +1,117 @@
+import logging
+import os
+import shlex
+import subprocess
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Representative diagrams for the class-data-sharing training run, so the
+# archive covers the parsers and layout engines that real documents load.
+_CDS_TRAINING_SOURCES = [
+    "@startuml\nAlice -> Bob: hello\nBob --> Alice: ok\n@enduml",
+    "@startuml\nclass A {\n  +run(): void\n}\nA <|-- B\n@enduml",
+    "@startuml\nstart\n:step;\nif (ok?) then (yes)\n  :done;\nendif\nstop\n@enduml",
+    "@startuml\n[*] --> Idle\nIdle --> Busy\n@enduml",
+    "@startmindmap\n* root\n** leaf\n@endmindmap",
+    '@startjson\n{"a": [1, 2]}\n@endjson',
+]
+
+_cds_lock = threading.Lock()
+_cds_failed: set[Path] = set()
+
+
+def _env_flag(name: str) -> bool:
+    return os.getenv(name, "").lower() in {"1", "true", "yes"}
+
+
+def jvm_options() -> list[str]:
+    """JVM flags from the environment: heap limits, GC and free-form extras.
+
+    ``CODOC_PLANTUML_JVM_MAX_HEAP`` caps the heap; a JVM that runs out of it
+    exits instead of limping on, so the caller sees the failure and the
+    pool replaces the process. The serial collector is the default because
+    a render is single-threaded and it has the cheapest startup.
+    """
+    options = ["-Djava.awt.headless=true"]
+    min_heap = os.getenv("CODOC_PLANTUML_JVM_MIN_HEAP", "")
+    if min_heap:
+        options.append(f"-Xms{min_heap}")
+    max_heap = os.getenv("CODOC_PLANTUML_JVM_MAX_HEAP", "512m")
+    if max_heap:
+        options.append(f"-Xmx{max_heap}")
+    options.append("-XX:+ExitOnOutOfMemoryError")
+    gc = os.getenv("CODOC_PLANTUML_JVM_GC", "SerialGC")
+    if gc:
+        options.append(f"-XX:+Use{gc}")
+    options.extend(shlex.split(os.getenv("CODOC_PLANTUML_JVM_OPTS", "")))
+    return options
+
+
+def cds_archive_path(jar_path: Path) -> Path:
+    """Archive location, versioned by the jar so an upgrade retrains it."""
+    stat = jar_path.stat()
+    return jar_path.with_name(f"{jar_path.stem}-{stat.st_size}-{stat.st_mtime_ns}.jsa")
+
+
+def ensure_cds_archive(jar_path: Path) -> Path | None:
+    """Create an AppCDS archive for ``jar_path`` on first use.
+
+    Runs PlantUML once over a few sample diagrams with
+    ``-XX:ArchiveClassesAtExit`` (JDK 13+). Returns ``None`` if the archive
+    cannot be built, and does not retry for that jar afterwards.
+    """
+    archive = cds_archive_path(jar_path)
+    if archive.exists():
+        return archive
+    with _cds_lock:
+        if archive.exists():
+            return archive
+        if archive in _cds_failed:
+            return None
+        tmp_archive = archive.with_suffix(".jsa.tmp")
+        command = [
+            os.getenv("CODOC_PLANTUML_JAVA", "java"),
+            *jvm_options(),
+            f"-XX:ArchiveClassesAtExit={tmp_archive}",
+            "-jar",
+            str(jar_path),
+            "-tsvg",
+            "-pipe",
+        ]
+        try:
+            result = subprocess.run(
+                command,
+                input="\n".join(_CDS_TRAINING_SOURCES).encode("utf-8"),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                check=False,
+                timeout=120,
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            result = None
+            error = str(e)
+        else:
+            error = result.stderr.decode("utf-8", errors="ignore")
+        if result is None or not tmp_archive.exists():
+            logger.warning("Could not create PlantUML CDS archive: %s", error)
+            _cds_failed.add(archive)
+            return None
+        tmp_archive.replace(archive)
+        logger.info("Created PlantUML CDS archive %s", archive)
+        return archive
+
+
+def java_command(jar_path: Path, *args: str) -> list[str]:
+    """Build a ``java -jar plantuml.jar`` command with the configured JVM flags.
+
+    With ``CODOC_PLANTUML_APPCDS`` on, the JVM maps a class-data-sharing
+    archive trained on PlantUML, which skips most class loading at startup.
+    """
+    command = [os.getenv("CODOC_PLANTUML_JAVA", "java"), *jvm_options()]
+    if _env_flag("CODOC_PLANTUML_APPCDS"):
+        archive = ensure_cds_archive(jar_path)
+        if archive is not None:
+            command += [f"-XX:SharedArchiveFile={archive}", "-Xshare:auto"]
+    return [*command, "-jar", str(jar_path), *args]
@@ -1,10 +1,55 @@
-import base64
+import asyncio
+import http.client
 import os
 import subprocess
-import zlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 from urllib.request import urlopen
 
+from codoc_in_plantuml.utils import encoding
+from codoc_in_plantuml.utils.blocks import block_format, split_blocks
+from codoc_in_plantuml.utils.http_pool import HTTPConnectionPool
+from codoc_in_plantuml.utils.jvm import java_command
+from codoc_in_plantuml.utils.metrics import FAST_BUCKETS, registry
+from codoc_in_plantuml.utils.render_cache import RenderCache, get_render_cache
+from codoc_in_plantuml.utils.render_daemon import (
+    FRAME_DELIMITER,
+    RenderSyntaxError,
+    RenderTimeoutError,
+    get_render_pool,
+    render_timeout,
+    split_error,
+    split_frames,
+)
+from codoc_in_plantuml.utils.single_flight import SingleFlight
+
+_render_seconds = registry.histogram(
+    "codoc_plantuml_render_seconds",
+    "Time to render one diagram (cache misses only).",
+    ("renderer", "format"),
+)
+_render_failures = registry.counter(
+    "codoc_plantuml_render_failures_total",
+    "Renders that raised, including timeouts.",
+    ("renderer", "format"),
+)
+_slot_wait_seconds = registry.histogram(
+    "codoc_plantuml_render_slot_wait_seconds",
+    "Time spent waiting for a free render slot.",
+)
+_encode_seconds = registry.histogram(
+    "codoc_plantuml_encode_seconds",
+    "Time to encode a source for a PlantUML URL.",
+    buckets=FAST_BUCKETS,
+)
+_cache_lookup_seconds = registry.histogram(
+    "codoc_plantuml_cache_lookup_seconds",
+    "Time to look up a render in the cache.",
+    buckets=FAST_BUCKETS,
+)
+
 
 class PlantUML:
     """Helper class to handle PlantUML encoding."""
@@ -15,6 +60,18 @@ class PlantUML:
         "https://github.com/plantuml/plantuml/releases/latest/download/plantuml.jar",
     )
 
+    RENDER_ROUTE = "/render"
+    # Longer GET paths are rejected by many proxies; send the source as a POST body.
+    _MAX_GET_PATH = 4000
+
+    _executor: ThreadPoolExecutor | None = None
+    _executor_lock = threading.Lock()
+    _slots: threading.BoundedSemaphore | None = None
+    _active_renders = 0
+    _in_flight = SingleFlight()
+    _server_pool: HTTPConnectionPool | None = None
+    _jar_versions: dict[Path, str] = {}
+
     @staticmethod
     def _default_jar_path() -> Path:
         repo_root = Path(__file__).resolve().parents[2]
@@ -35,76 +92,77 @@ class PlantUML:
             jar_path.write_bytes(response.read())
         return jar_path
 
-    @staticmethod
-    def _encode6bit(b: int) -> str:
-        if b < 10:
-            return chr(48 + b)
-        b -= 10
-        if b < 26:
-            return chr(65 + b)
-        b -= 26
-        if b < 26:
-            return chr(97 + b)
-        b -= 26
-        if b == 0:
-            return "-"
-        if b == 1:
-            return "_"
-        return "?"
-
-    @staticmethod
-    def _append3bytes(b1: int, b2: int, b3: int) -> str:
-        c1 = b1 >> 2
-        c2 = (b1 & 3) << 4 | b2 >> 4
-        c3 = (b2 & 15) << 2 | b3 >> 6
-        c4 = b3 & 63
-        return (
-            PlantUML._encode6bit(c1)
-            + PlantUML._encode6bit(c2)
-            + PlantUML._encode6bit(c3)
-            + PlantUML._encode6bit(c4)
-        )
-
     @staticmethod
     def encode(text: str) -> str:
         """Encodes PlantUML text using the correct deflate + custom 6-bit algorithm."""
-        if not text:
-            return ""
-        data = text.encode("utf-8")
-        compressed = zlib.compress(data, 9)[2:-4]
-        result = ""
-        i = 0
-        length = len(compressed)
-        while i < length:
-            if i + 2 < length:
-                result += PlantUML._append3bytes(
-                    compressed[i], compressed[i + 1], compressed[i + 2]
-                )
-            elif i + 1 < length:
-                result += PlantUML._append3bytes(compressed[i], compressed[i + 1], 0)
-            else:
-                result += PlantUML._append3bytes(compressed[i], 0, 0)
-            i += 3
-        return result
+        with _encode_seconds.time():
+            return encoding.encode(text)
+
+    @staticmethod
+    def decode(encoded: str) -> str:
+        return encoding.decode(encoded)
+
+    @staticmethod
+    def _server_base() -> str:
+        base = os.getenv("CODOC_PLANTUML_SERVER", "https://www.plantuml.com/plantuml")
+        return base.rstrip("/")
 
     @staticmethod
     def get_url(text: str, format: str = "svg") -> str:
         encoded = PlantUML.encode(text)
-        base = os.getenv("CODOC_PLANTUML_SERVER", "https://www.plantuml.com/plantuml")
-        base = base.rstrip("/")
-        return f"{base}/{format}/{encoded}"
+        return f"{PlantUML._server_base()}/{format}/{encoded}"
+
+    @staticmethod
+    def _use_proxy() -> bool:
+        return os.getenv("CODOC_PLANTUML_PROXY", "").lower() in {"1", "true", "yes"}
+
+    @staticmethod
+    def _get_server_pool() -> HTTPConnectionPool:
+        with PlantUML._executor_lock:
+            if PlantUML._server_pool is None:
+                PlantUML._server_pool = HTTPConnectionPool(
+                    PlantUML._server_base(),
+                    size=PlantUML._max_renders(),
+                    timeout=render_timeout(),
+                )
+            return PlantUML._server_pool
+
+    @staticmethod
+    def _render_with_server(text: str, format: str = "svg") -> bytes:
+        """Fetch a render from the PlantUML server over a pooled connection."""
+        if not text:
+            return b""
+        try:
+            pool = PlantUML._get_server_pool()
+            path = f"/{format}/{PlantUML.encode(text)}"
+            if len(pool.base_path + path) <= PlantUML._MAX_GET_PATH:
+                result = pool.request("GET", path)
+            else:
+                result = pool.request(
+                    "POST",
+                    f"/{format}",
+                    body=text.encode("utf-8"),
+                    headers={"Content-Type": "text/plain; charset=utf-8"},
+                )
+        except (http.client.HTTPException, ValueError) as e:
+            # A broken response or a malformed CODOC_PLANTUML_SERVER.
+            raise RuntimeError(f"PlantUML server request failed: {e!r}") from e
+        if result.status == 200:
+            return result.body
+        # Syntax errors come back as 400 with an image of the error, which
+        # must not replace the last good diagram.
+        error = result.headers.get("X-PlantUML-Diagram-Error")
+        if result.status == 400 and error:
+            raise RenderSyntaxError(error)
+        raise RuntimeError(f"PlantUML server returned HTTP {result.status}")
 
     @staticmethod
     def _render_with_jar(text: str, format: str = "svg") -> bytes:
         if not text:
             return b""
         jar_path = PlantUML._ensure_jar()
-        result = subprocess.run(
-            ["java", "-jar", str(jar_path), f"-t{format}", "-pipe"],
-            input=text.encode("utf-8"),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=False,
+        result = PlantUML._run_jar(
+            java_command(jar_path, f"-t{format}", "-pipe"), text.encode("utf-8")
         )
         if result.returncode != 0:
             raise RuntimeError(
@@ -113,16 +171,355 @@ class PlantUML:
         return result.stdout
 
     @staticmethod
-    def _to_data_url(content: bytes, format: str) -> str:
-        if not content:
-            return ""
-        mime = "image/svg+xml" if format == "svg" else f"image/{format}"
-        encoded = base64.b64encode(content).decode("ascii")
-        return f"data:{mime};base64,{encoded}"
+    def _run_jar(command: list[str], stdin: bytes) -> subprocess.CompletedProcess:
+        timeout = render_timeout()
+        try:
+            # subprocess.run kills the JVM when the timeout expires.
+            return subprocess.run(
+                command,
+                input=stdin,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                check=False,
+                timeout=timeout,
+            )
+        except subprocess.TimeoutExpired:
+            raise RenderTimeoutError(
+                f"PlantUML render timed out after {timeout:.0f}s"
+            ) from None
+
+    @staticmethod
+    def _max_renders() -> int:
+        try:
+            return max(1, int(os.getenv("CODOC_PLANTUML_MAX_RENDERS", "")))
+        except ValueError:
+            return os.cpu_count() or 1
+
+    @staticmethod
+    @contextmanager
+    def _render_slot():
+        """Hold one of the ``CODOC_PLANTUML_MAX_RENDERS`` jar render slots."""
+        with PlantUML._executor_lock:
+            if PlantUML._slots is None:
+                PlantUML._slots = threading.BoundedSemaphore(PlantUML._max_renders())
+        with _slot_wait_seconds.time():
+            acquired = PlantUML._slots.acquire(timeout=render_timeout())
+        if not acquired:
+            raise RenderTimeoutError("All PlantUML renderers are busy")
+        with PlantUML._executor_lock:
+            PlantUML._active_renders += 1
+        try:
+            yield
+        finally:
+            with PlantUML._executor_lock:
+                PlantUML._active_renders -= 1
+            PlantUML._slots.release()
+
+    @staticmethod
+    def _use_daemon() -> bool:
+        return os.getenv("CODOC_PLANTUML_DAEMON", "1").lower() not in {"0", "false", "no"}
+
+    @staticmethod
+    def _render_with_daemon(text: str, format: str = "svg") -> bytes:
+        """Render through the pool of warm PlantUML JVMs (first diagram only)."""
+        if not text:
+            return b""
+        frames = get_render_pool(PlantUML._ensure_jar()).render(text, format)
+        if not frames:
+            return b""
+        image, error = split_error(frames[0])
+        if error is not None:
+            raise RenderSyntaxError(error)
+        return image
+
+    @staticmethod
+    def _render_blocks_with_jar(blocks: list[str], format: str = "svg") -> list[bytes]:
+        """Render many blocks with a single one-shot JVM."""
+        jar_path = PlantUML._ensure_jar()
+        result = PlantUML._run_jar(
+            java_command(
+                jar_path,
+                f"-t{format}",
+                "-pipe",
+                "-pipeNoStderr",
+                "-pipedelimitor",
+                FRAME_DELIMITER,
+            ),
+            "".join(f"{block}\n" for block in blocks).encode("utf-8"),
+        )
+        frames = split_frames(result.stdout)
+        # PlantUML exits non-zero if any diagram had an error but still
+        # draws an error image for it, so only a missing frame is fatal.
+        if len(frames) != len(blocks):
+            raise RuntimeError(
+                f"PlantUML render failed: {result.stderr.decode('utf-8', errors='ignore')}"
+            )
+        return [split_error(frame)[0] for frame in frames]
+
+    @staticmethod
+    def _render_blocks(blocks: list[str], format: str = "svg") -> list[bytes]:
+        if not PlantUML._use_daemon():
+            with PlantUML._render_slot():
+                return PlantUML._render_blocks_with_jar(blocks, format)
+        pool = get_render_pool(PlantUML._ensure_jar())
+        # One streamed request per warm worker keeps every JVM busy.
+        chunk_size = -(-len(blocks) // pool.size)
+        chunks = [
+            blocks[i : i + chunk_size] for i in range(0, len(blocks), chunk_size)
+        ]
+
+        def render_chunk(chunk: list[str]) -> list[bytes]:
+            with PlantUML._render_slot():
+                frames = pool.render_blocks(chunk, format)
+            return [split_error(frame)[0] for frame in frames]
+
+        if len(chunks) == 1:
+            return render_chunk(chunks[0])
+        with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+            results = executor.map(render_chunk, chunks)
+            return [frame for frames in results for frame in frames]
+
+    @staticmethod
+    def render_many(sources: list[str], format: str = "svg") -> list[bytes]:
+        """Render many sources in batched JVM round trips.
+
+        Returns the first diagram of each source in order. Cached sources are
+        served from the render cache and duplicates are rendered once.
+        """
+        results = [b""] * len(sources)
+        cache = PlantUML.render_cache()
+        missing: dict[str, list[int]] = {}
+        first_blocks: dict[str, str] = {}
+        for index, text in enumerate(sources):
+            if not text:
+                continue
+            key = PlantUML._cache_key(text, format)
+            if key not in missing:
+                content = cache.get(key)
+                if content is not None:
+                    results[index] = content
+                    continue
+                blocks = split_blocks(text)
+                if not blocks:
+                    continue
+                first_blocks[key] = blocks[0]
+            missing.setdefault(key, []).append(index)
+        keys = list(missing)
+        if keys:
+            frames = PlantUML._render_blocks([first_blocks[k] for k in keys], format)
+            for key, frame in zip(keys, frames):
+                cache.put(key, frame)
+                for index in missing[key]:
+                    results[index] = frame
+        return results
+
+    @staticmethod
+    def _renderer_version() -> str:
+        """Identify the renderer so cache entries do not outlive an upgrade.
+
+        A jar is looked at (and first downloaded) once per process, so the
+        first call can block; keep it off the event loop.
+        """
+        if not PlantUML._use_jar():
+            return f"server:{PlantUML._server_base()}"
+        jar_path = PlantUML._default_jar_path()
+        version = PlantUML._jar_versions.get(jar_path)
+        if version is None:
+            stat = PlantUML._ensure_jar().stat()
+            version = f"jar:{stat.st_size}:{stat.st_mtime_ns}"
+            PlantUML._jar_versions[jar_path] = version
+        return version
+
+    @staticmethod
+    def render(text: str, format: str = "svg") -> bytes:
+        """Render with the local jar (or the proxied server), serving repeated
+        sources from the cache."""
+        if not text:
+            return b""
+        key = PlantUML._cache_key(text, format)
+        content = PlantUML._cache_lookup(key)
+        if content is None:
+            # Collaborators in a room ask for the same source at the same time;
+            # let one of them render and hand the bytes to everyone else.
+            content = PlantUML._in_flight.run(
+                key, PlantUML._render_uncached, key, text, format
+            )
+        return content
+
+    @staticmethod
+    def render_cache() -> RenderCache:
+        return get_render_cache(PlantUML._default_jar_path().parent)
+
+    @staticmethod
+    def _cache_lookup(key: str) -> bytes | None:
+        with _cache_lookup_seconds.time():
+            return PlantUML.render_cache().get(key)
+
+    @staticmethod
+    def _cache_key(text: str, format: str) -> str:
+        return RenderCache.key(text, format, PlantUML._renderer_version())
+
+    @staticmethod
+    def _keyed_lookup(text: str, format: str) -> tuple[str, bytes | None]:
+        """Cache key of ``text`` and its cached render, if any. May touch the
+        jar and the disk tier, so ``render_async`` runs it in a thread."""
+        key = PlantUML._cache_key(text, format)
+        return key, PlantUML._cache_lookup(key)
+
+    @staticmethod
+    def _render_uncached(key: str, text: str, format: str) -> bytes:
+        if not PlantUML._use_jar():
+            renderer, render = "server", PlantUML._render_with_server
+        elif PlantUML._use_daemon():
+            renderer, render = "daemon", PlantUML._render_with_daemon
+        else:
+            renderer, render = "jar", PlantUML._render_with_jar
+        with PlantUML._render_slot():
+            try:
+                with _render_seconds.time(renderer=renderer, format=format):
+                    content = render(text, format)
+            except Exception:
+                _render_failures.inc(renderer=renderer, format=format)
+                raise
+        PlantUML.render_cache().put(key, content)
+        return content
+
+    @staticmethod
+    def _render_executor() -> ThreadPoolExecutor:
+        with PlantUML._executor_lock:
+            if PlantUML._executor is None:
+                PlantUML._executor = ThreadPoolExecutor(
+                    max_workers=PlantUML._max_renders(),
+                    thread_name_prefix="plantuml-render",
+                )
+            return PlantUML._executor
+
+    @staticmethod
+    async def render_async(text: str, format: str = "svg") -> bytes:
+        """Like ``render`` but runs off the event loop."""
+        if not text:
+            return b""
+        _, content = await PlantUML._render_keyed_async(text, format)
+        return content
+
+    @staticmethod
+    async def _render_keyed_async(text: str, format: str) -> tuple[str, bytes]:
+        # Hashing, the renderer version and the disk tier all stay off the
+        # loop; only a miss goes on to the render executor.
+        key, content = await asyncio.to_thread(PlantUML._keyed_lookup, text, format)
+        if content is not None:
+            return key, content
+        future = PlantUML._in_flight.submit(
+            key,
+            PlantUML._render_executor(),
+            PlantUML._render_uncached,
+            key,
+            text,
+            format,
+        )
+        # Shield the shared future so one cancelled waiter does not cancel it
+        # for everyone else waiting on the same render.
+        return key, await asyncio.shield(asyncio.wrap_future(future))
 
     @staticmethod
-    def get_image_source(text: str, format: str = "svg") -> str:
-        use_jar = os.getenv("CODOC_PLANTUML_USE_JAR", "").lower() in {"1", "true", "yes"}
-        if use_jar:
-            return PlantUML._to_data_url(PlantUML._render_with_jar(text, format), format)
-        return PlantUML.get_url(text, format)
\ No newline at end of file
+    def _use_jar() -> bool:
+        return os.getenv("CODOC_PLANTUML_USE_JAR", "").lower() in {"1", "true", "yes"}
+
+    @staticmethod
+    def _renders_on_backend() -> bool:
+        """Whether the backend renders and serves images (jar or proxy mode)."""
+        return PlantUML._use_jar() or PlantUML._use_proxy()
+
+    @staticmethod
+    def _render_url(key: str, format: str) -> str:
+        from reflex.config import get_config
+
+        base = get_config().api_url.rstrip("/")
+        return f"{base}{PlantUML.RENDER_ROUTE}/{key}.{format}"
+
+    @staticmethod
+    async def _image_source_async(text: str, format: str = "svg") -> str:
+        """A URL for the image of ``text``.
+
+        In jar and proxy mode it is a backend ``RENDER_ROUTE`` URL: the bytes
+        stay in the render cache, so state deltas only carry a short URL.
+        """
+        if PlantUML._renders_on_backend():
+            if not text:
+                return ""
+            key, _ = await PlantUML._render_keyed_async(text, format)
+            # Pages may ask for the URL long after the bytes left the cache.
+            PlantUML.render_cache().remember(key, text, format)
+            return PlantUML._render_url(key, format)
+        return PlantUML.get_url(text, format)
+
+    @staticmethod
+    async def get_block_sources_async(text: str) -> list[str]:
+        """Image sources for each ``@start...@end`` block of ``text``.
+
+        Blocks render and cache independently, so editing one diagram of a
+        long document re-renders only that block; the rest are cache hits.
+        A failed block raises, so callers can keep showing the previous
+        images.
+        """
+        blocks = split_blocks(text)
+        return list(
+            await asyncio.gather(
+                *(
+                    PlantUML._image_source_async(block, block_format(block))
+                    for block in blocks
+                )
+            )
+        )
+
+
+def _cache_stat(name: str):
+    return lambda: PlantUML.render_cache().stats()[name]
+
+
+registry.callback(
+    "codoc_plantuml_cache_hits_total",
+    "Render cache hits (memory or disk).",
+    _cache_stat("hits"),
+    type="counter",
+)
+registry.callback(
+    "codoc_plantuml_cache_disk_hits_total",
+    "Render cache hits served from the disk tier.",
+    _cache_stat("disk_hits"),
+    type="counter",
+)
+registry.callback(
+    "codoc_plantuml_cache_misses_total",
+    "Render cache misses.",
+    _cache_stat("misses"),
+    type="counter",
+)
+registry.callback(
+    "codoc_plantuml_cache_evictions_total",
+    "Render cache evictions from memory or disk.",
+    _cache_stat("evictions"),
+    type="counter",
+)
+registry.callback(
+    "codoc_plantuml_cache_entries", "Renders held in memory.", _cache_stat("entries")
+)
+registry.callback(
+    "codoc_plantuml_cache_bytes", "Bytes of renders held in memory.", _cache_stat("bytes")
+)
+registry.callback(
+    "codoc_plantuml_renders_in_flight",
+    "Distinct renders requested and not yet finished, queued or running.",
+    PlantUML._in_flight.in_flight,
+)
+registry.callback(
+    "codoc_plantuml_renders_active",
+    "Renders currently holding a render slot.",
+    lambda: PlantUML._active_renders,
+)
+registry.callback(
+    "codoc_plantuml_renders_coalesced_total",
+    "Render requests that joined an identical render already in flight.",
+    lambda: PlantUML._in_flight.joined,
+    type="counter",
+)
@@ -0,0 +1,187 @@
+import random
+import time
+from dataclasses import dataclass, field
+
+from codoc_in_plantuml.utils.metrics import registry
+
+# Editors send a heartbeat this often; a user is gone after missing several.
+# Browsers run timers in background tabs as rarely as once a minute, so the
+# TTL has to cover a couple of those without dropping anyone.
+HEARTBEAT_SECONDS = 15.0
+PRESENCE_TTL = 10 * HEARTBEAT_SECONDS
+# Presence changes in a room are published at most this often.
+PUBLISH_INTERVAL = 0.25
+# Backend endpoint the browser sends heartbeats and leaves to.
+PRESENCE_ROUTE = "/presence"
+
+_ADJECTIVES = [
+    "Swift",
+    "Calm",
+    "Bright",
+    "Eager",
+    "Merry",
+    "Witty",
+    "Brave",
+    "Jolly",
+    "Kind",
+]
+_NOUNS = ["Fox", "Bear", "Owl", "Cat", "Dog", "Lion", "Tiger", "Hawk", "Wolf"]
+_COLORS = [
+    "bg-red-500",
+    "bg-orange-500",
+    "bg-amber-500",
+    "bg-yellow-500",
+    "bg-lime-500",
+    "bg-green-500",
+    "bg-emerald-500",
+    "bg-teal-500",
+    "bg-cyan-500",
+    "bg-sky-500",
+    "bg-blue-500",
+    "bg-indigo-500",
+    "bg-violet-500",
+    "bg-purple-500",
+    "bg-fuchsia-500",
+    "bg-pink-500",
+    "bg-rose-500",
+]
+
+
+@dataclass
+class _Member:
+    name: str
+    color: str
+    last_seen: float
+
+
+@dataclass
+class _Room:
+    members: dict[str, _Member] = field(default_factory=dict)
+    publish_pending: bool = False
+    last_publish: float = 0.0
+
+
+class Presence:
+    """Who is in each room, by client token, kept outside the shared state.
+
+    Heartbeats only refresh a timestamp here, so they never touch the
+    document state; a room's member list is republished only when someone
+    joins, leaves or expires, and at most every ``PUBLISH_INTERVAL``.
+    """
+
+    def __init__(self, ttl: float = PRESENCE_TTL, interval: float = PUBLISH_INTERVAL):
+        self.ttl = ttl
+        self.interval = interval
+        self.expired = 0
+        self._rooms: dict[str, _Room] = {}
+        self._token_rooms: dict[str, str] = {}
+
+    def join(self, room: str, token: str) -> list[str]:
+        """Add ``token`` to ``room``; returns the rooms whose members changed.
+
+        A tab that moves to another document leaves its previous room.
+        """
+        changed = []
+        previous = self._token_rooms.get(token)
+        if previous is not None and previous != room and self.leave(previous, token):
+            changed.append(previous)
+        state = self._rooms.setdefault(room, _Room())
+        member = state.members.get(token)
+        if member is not None:
+            member.last_seen = time.monotonic()
+            return changed
+        state.members[token] = _Member(
+            name=f"{random.choice(_ADJECTIVES)} {random.choice(_NOUNS)}",
+            color=random.choice(_COLORS),
+            last_seen=time.monotonic(),
+        )
+        self._token_rooms[token] = room
+        changed.append(room)
+        return changed
+
+    def beat(self, room: str, token: str) -> bool:
+        """Refresh a member; False if ``token`` is not in ``room``."""
+        state = self._rooms.get(room)
+        member = state.members.get(token) if state is not None else None
+        if member is None:
+            return False
+        member.last_seen = time.monotonic()
+        return True
+
+    def leave(self, room: str, token: str) -> bool:
+        state = self._rooms.get(room)
+        if state is None or state.members.pop(token, None) is None:
+            return False
+        if self._token_rooms.get(token) == room:
+            del self._token_rooms[token]
+        return True
+
+    def expire(self) -> list[str]:
+        """Drop members whose heartbeats stopped; returns the rooms changed."""
+        cutoff = time.monotonic() - self.ttl
+        changed = []
+        for room, state in self._rooms.items():
+            gone = [t for t, m in state.members.items() if m.last_seen < cutoff]
+            for token in gone:
+                del state.members[token]
+                if self._token_rooms.get(token) == room:
+                    del self._token_rooms[token]
+            if gone:
+                self.expired += len(gone)
+                changed.append(room)
+        return changed
+
+    def members(self, room: str) -> list[tuple[str, str]]:
+        """``(name, color)`` of everyone in ``room``, in order of arrival."""
+        state = self._rooms.get(room)
+        if state is None:
+            return []
+        return [(member.name, member.color) for member in state.members.values()]
+
+    def tokens(self, room: str) -> list[str]:
+        state = self._rooms.get(room)
+        return list(state.members) if state is not None else []
+
+    def schedule_publish(self, room: str) -> float | None:
+        """Seconds to wait before publishing ``room``, or None if a publish
+        is already pending and will pick up the change."""
+        state = self._rooms.setdefault(room, _Room())
+        if state.publish_pending:
+            return None
+        state.publish_pending = True
+        return max(0.0, state.last_publish + self.interval - time.monotonic())
+
+    def published(self, room: str) -> None:
+        state = self._rooms.get(room)
+        if state is None:
+            return
+        if not state.members:
+            del self._rooms[room]
+            return
+        state.publish_pending = False
+        state.last_publish = time.monotonic()
+
+    def forget(self, room: str) -> None:
+        state = self._rooms.pop(room, None)
+        if state is not None:
+            for token in state.members:
+                if self._token_rooms.get(token) == room:
+                    del self._token_rooms[token]
+
+    def count(self) -> int:
+        return len(self._token_rooms)
+
+
+presence = Presence()
+
+registry.callback(
+    "codoc_plantuml_present_users",
+    "Users with a live heartbeat, across all rooms.",
+    presence.count,
+)
+registry.callback(
+    "codoc_plantuml_presence_expired_total",
+    "Users dropped from a room after missing their heartbeats.",
+    lambda: presence.expired,
+    type="counter",
+)
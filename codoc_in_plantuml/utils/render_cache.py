@@ -0,0 +1,218 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class RenderCache:
+    """Content-addressed cache of rendered diagrams.
+
+    Entries live in a byte-bounded in-memory LRU; when ``disk_dir`` is set,
+    they are also written to disk (bounded by ``disk_max_bytes``, evicted by
+    least recent access) and promoted back into memory on a hit.
+
+    Separately, the sources behind keys handed out as URLs are remembered
+    (bounded by ``sources_max_bytes``), so an image evicted from both tiers
+    can be rendered again when a page still asks for it.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        disk_dir: Path | None = None,
+        disk_max_bytes: int = 512 * 1024 * 1024,
+        sources_max_bytes: int = 16 * 1024 * 1024,
+    ):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.sources_max_bytes = sources_max_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._size = 0
+        self._disk_size: int | None = None
+        self._sources: OrderedDict[str, tuple[str, str]] = OrderedDict()
+        self._sources_size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text: str, format: str, renderer: str = "") -> str:
+        digest = hashlib.sha256()
+        for part in (renderer, format, text):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            content = self._entries.get(key)
+            if content is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return content
+        content = self._read_disk(key)
+        with self._lock:
+            if content is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._store(key, content)
+            return content
+
+    def put(self, key: str, content: bytes) -> None:
+        with self._lock:
+            self._store(key, content)
+        self._write_disk(key, content)
+
+    def remember(self, key: str, text: str, format: str) -> None:
+        """Record the source of ``key``, so a miss can be rendered again."""
+        size = len(text)
+        if size > self.sources_max_bytes:
+            return
+        with self._lock:
+            if key in self._sources:
+                self._sources.move_to_end(key)
+                return
+            self._sources[key] = (text, format)
+            self._sources_size += size
+            while self._sources_size > self.sources_max_bytes:
+                _, (evicted, _) = self._sources.popitem(last=False)
+                self._sources_size -= len(evicted)
+
+    def source(self, key: str) -> tuple[str, str] | None:
+        """``(text, format)`` remembered for ``key``, if any."""
+        with self._lock:
+            source = self._sources.get(key)
+            if source is not None:
+                self._sources.move_to_end(key)
+            return source
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            if key in self._entries:
+                return True
+        return self.disk_dir is not None and self._disk_path(key).exists()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _store(self, key: str, content: bytes) -> None:
+        if len(content) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= len(previous)
+        self._entries[key] = content
+        self._size += len(content)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+            self.evictions += 1
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / key
+
+    def _read_disk(self, key: str) -> bytes | None:
+        if self.disk_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            content = path.read_bytes()
+            path.touch()
+        except OSError:
+            return None
+        return content
+
+    def _write_disk(self, key: str, content: bytes) -> None:
+        if self.disk_dir is None or len(content) > self.disk_max_bytes:
+            return
+        path = self._disk_path(key)
+        try:
+            if path.exists():
+                return
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_bytes(content)
+            tmp_path.replace(path)
+        except OSError as e:
+            logger.warning("Could not write render cache entry %s: %s", path, e)
+            return
+        with self._lock:
+            if self._disk_size is None:
+                self._disk_size = sum(
+                    p.stat().st_size for p in self.disk_dir.glob("*/*") if p.is_file()
+                )
+            else:
+                self._disk_size += len(content)
+            if self._disk_size > self.disk_max_bytes:
+                self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        files = sorted(
+            (p.stat().st_mtime, p.stat().st_size, p)
+            for p in self.disk_dir.glob("*/*")
+            if p.is_file()
+        )
+        self._disk_size = sum(size for _, size, _ in files)
+        # Trim to 90% of the budget so we do not rescan on every write.
+        target = self.disk_max_bytes * 0.9
+        for _, size, path in files:
+            if self._disk_size <= target:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            self._disk_size -= size
+            self.evictions += 1
+
+
+_cache: RenderCache | None = None
+_cache_lock = threading.Lock()
+
+
+def _env_megabytes(name: str, default: int) -> int:
+    try:
+        return int(float(os.getenv(name, "")) * 1024 * 1024)
+    except ValueError:
+        return default * 1024 * 1024
+
+
+def get_render_cache(cache_dir: Path) -> RenderCache:
+    """Return the process-wide render cache, creating it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            use_disk = os.getenv("CODOC_PLANTUML_DISK_CACHE", "").lower() in {
+                "1",
+                "true",
+                "yes",
+            }
+            _cache = RenderCache(
+                max_bytes=_env_megabytes("CODOC_PLANTUML_CACHE_MB", 64),
+                disk_dir=cache_dir / "renders" if use_disk else None,
+                disk_max_bytes=_env_megabytes("CODOC_PLANTUML_DISK_CACHE_MB", 512),
+                sources_max_bytes=_env_megabytes("CODOC_PLANTUML_SOURCE_INDEX_MB", 16),
+            )
+        return _cache
@@ -0,0 +1,330 @@
+import atexit
+import logging
+import os
+import queue
+import re
+import subprocess
+import threading
+from collections import deque
+from pathlib import Path
+
+from codoc_in_plantuml.utils.blocks import split_blocks
+from codoc_in_plantuml.utils.jvm import java_command
+from codoc_in_plantuml.utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+FRAME_DELIMITER = "___CODOC_PLANTUML_FRAME___"
+_FRAME_RE = re.compile(re.escape(FRAME_DELIMITER.encode("ascii")) + rb"\r?\n")
+_PING_SOURCE = "@startuml\n@enduml"
+# With -pipeNoStderr, PlantUML follows the error image of a diagram it could
+# not parse with "ERROR", the line number and the messages, on stdout and
+# before the delimiter, so each report arrives with its own frame.
+_ERROR_RE = re.compile(rb"ERROR\r?\n-?\d+\r?\n(.*)\Z", re.DOTALL)
+_ERROR_TAIL = 4096
+
+
+def split_frames(output: bytes) -> list[bytes]:
+    """Split ``-pipedelimitor`` output into one image per diagram."""
+    frames = []
+    start = 0
+    for match in _FRAME_RE.finditer(output):
+        frames.append(output[start : match.start()])
+        start = match.end()
+    return frames
+
+
+def split_error(frame: bytes) -> tuple[bytes, str | None]:
+    """The image in ``frame`` and PlantUML's error message, if it drew one."""
+    tail = max(0, len(frame) - _ERROR_TAIL)
+    match = _ERROR_RE.search(frame, tail)
+    if match is None:
+        return frame, None
+    message = match.group(1).decode("utf-8", errors="replace").strip()
+    return frame[: match.start()], " ".join(message.split()) or "Syntax error"
+
+
+class RenderDaemonError(RuntimeError):
+    """Raised when a warm PlantUML process cannot complete a render."""
+
+
+class RenderTimeoutError(RenderDaemonError):
+    """Raised when a render does not finish within the configured timeout."""
+
+
+class RenderSyntaxError(RuntimeError):
+    """Raised when PlantUML answers with an error image instead of a diagram."""
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, ""))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, ""))
+    except ValueError:
+        return default
+
+
+def render_timeout() -> float:
+    """Wall-clock limit for a single render, in seconds."""
+    return _env_float("CODOC_PLANTUML_RENDER_TIMEOUT", 30.0)
+
+
+class PlantUMLWorker:
+    """A long-lived PlantUML JVM speaking the ``-pipe`` protocol.
+
+    Requests are ``@start...@end`` blocks written to stdin; PlantUML answers
+    each block with one image followed by ``FRAME_DELIMITER`` on stdout.
+    """
+
+    def __init__(self, jar_path: Path, format: str):
+        self.jar_path = jar_path
+        self.format = format
+        self.renders = 0
+        self._process: subprocess.Popen | None = None
+        self._frames: queue.Queue[bytes | None] = queue.Queue()
+        self._stderr: deque[str] = deque(maxlen=50)
+        self._lock = threading.Lock()
+
+    def command(self) -> list[str]:
+        return java_command(
+            self.jar_path,
+            f"-t{self.format}",
+            "-charset",
+            "UTF-8",
+            "-pipe",
+            "-pipeNoStderr",
+            "-pipedelimitor",
+            FRAME_DELIMITER,
+        )
+
+    def start(self) -> None:
+        self._frames = queue.Queue()
+        self._stderr.clear()
+        self._process = subprocess.Popen(
+            self.command(),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=0,
+        )
+        threading.Thread(
+            target=self._read_frames, args=(self._process, self._frames), daemon=True
+        ).start()
+        threading.Thread(
+            target=self._read_stderr, args=(self._process,), daemon=True
+        ).start()
+
+    def stop(self) -> None:
+        process, self._process = self._process, None
+        if process is None or process.poll() is not None:
+            return
+        process.kill()
+        process.wait()
+
+    def restart(self) -> None:
+        self.stop()
+        self.start()
+
+    def is_alive(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def render(self, text: str, timeout: float) -> list[bytes]:
+        """Render every block of ``text`` and return one image per block."""
+        return self.render_blocks(split_blocks(text), timeout)
+
+    def render_blocks(self, blocks: list[str], timeout: float) -> list[bytes]:
+        """Stream ``@start...@end`` blocks through the JVM in one request."""
+        if not blocks:
+            return []
+        payload = "".join(f"{block}\n" for block in blocks).encode("utf-8")
+        with self._lock:
+            if not self.is_alive():
+                raise RenderDaemonError("PlantUML daemon is not running")
+            try:
+                self._process.stdin.write(payload)
+                self._process.stdin.flush()
+            except OSError as e:
+                raise RenderDaemonError(f"PlantUML daemon write failed: {e}") from e
+            frames = []
+            for _ in blocks:
+                try:
+                    frame = self._frames.get(timeout=timeout)
+                except queue.Empty:
+                    self.stop()
+                    raise RenderTimeoutError(
+                        f"PlantUML daemon timed out after {timeout:.0f}s"
+                    ) from None
+                if frame is None:
+                    raise RenderDaemonError(
+                        f"PlantUML daemon exited: {' '.join(self._stderr)}"
+                    )
+                frames.append(frame)
+            self.renders += 1
+            return frames
+
+    def ping(self, timeout: float) -> bool:
+        try:
+            self.render(_PING_SOURCE, timeout)
+        except RenderDaemonError:
+            return False
+        return True
+
+    @staticmethod
+    def _read_frames(process: subprocess.Popen, frames: queue.Queue) -> None:
+        buffer = b""
+        while True:
+            chunk = process.stdout.read(65536)
+            if not chunk:
+                frames.put(None)
+                return
+            buffer += chunk
+            while True:
+                match = _FRAME_RE.search(buffer)
+                if match is None:
+                    break
+                frames.put(buffer[: match.start()])
+                buffer = buffer[match.end() :]
+
+    def _read_stderr(self, process: subprocess.Popen) -> None:
+        for line in process.stderr:
+            self._stderr.append(line.decode("utf-8", errors="ignore").rstrip())
+
+
+class RenderPool:
+    """A fixed-size pool of warm PlantUML workers per output format.
+
+    Workers are started lazily on the first request for a format, replaced
+    when they crash, and pinged by a background health check while idle.
+    """
+
+    def __init__(
+        self,
+        jar_path: Path,
+        size: int = 2,
+        timeout: float = 30.0,
+        health_interval: float = 30.0,
+    ):
+        self.jar_path = jar_path
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self.restarts = 0
+        self._idle: dict[str, queue.Queue[PlantUMLWorker]] = {}
+        self._workers: list[PlantUMLWorker] = []
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._health_thread: threading.Thread | None = None
+
+    def _idle_queue(self, format: str) -> queue.Queue[PlantUMLWorker]:
+        with self._lock:
+            if self._closed.is_set():
+                raise RenderDaemonError("PlantUML render pool is closed")
+            idle = self._idle.get(format)
+            if idle is None:
+                idle = queue.Queue()
+                for _ in range(self.size):
+                    worker = PlantUMLWorker(self.jar_path, format)
+                    worker.start()
+                    self._workers.append(worker)
+                    idle.put(worker)
+                self._idle[format] = idle
+                self._start_health_check()
+            return idle
+
+    def render(self, text: str, format: str = "svg") -> list[bytes]:
+        return self.render_blocks(split_blocks(text), format)
+
+    def render_blocks(self, blocks: list[str], format: str = "svg") -> list[bytes]:
+        if not blocks:
+            return []
+        idle = self._idle_queue(format)
+        try:
+            worker = idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise RenderTimeoutError(
+                f"No PlantUML {format} daemon became free within {self.timeout:.0f}s"
+            ) from None
+        try:
+            if not worker.is_alive():
+                self._restart(worker)
+            try:
+                return worker.render_blocks(blocks, self.timeout)
+            except RenderTimeoutError:
+                self._restart(worker)
+                raise
+            except RenderDaemonError:
+                if worker.is_alive():
+                    raise
+                # The JVM died underneath us; retry once on a fresh process.
+                self._restart(worker)
+                return worker.render_blocks(blocks, self.timeout)
+        finally:
+            idle.put(worker)
+
+    def _restart(self, worker: PlantUMLWorker) -> None:
+        logger.warning("Restarting PlantUML %s daemon", worker.format)
+        worker.restart()
+        self.restarts += 1
+
+    def _start_health_check(self) -> None:
+        if self._health_thread is not None or self.health_interval <= 0:
+            return
+        self._health_thread = threading.Thread(target=self._health_loop, daemon=True)
+        self._health_thread.start()
+
+    def _health_loop(self) -> None:
+        while not self._closed.wait(self.health_interval):
+            for idle in list(self._idle.values()):
+                for _ in range(idle.qsize()):
+                    try:
+                        worker = idle.get_nowait()
+                    except queue.Empty:
+                        break
+                    try:
+                        if not worker.ping(min(self.timeout, 10.0)):
+                            self._restart(worker)
+                    finally:
+                        idle.put(worker)
+
+    def close(self) -> None:
+        self._closed.set()
+        with self._lock:
+            for worker in self._workers:
+                worker.stop()
+            self._workers.clear()
+            self._idle.clear()
+
+
+_pool: RenderPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_render_pool(jar_path: Path) -> RenderPool:
+    """Return the process-wide render pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = RenderPool(
+                jar_path,
+                size=_env_int("CODOC_PLANTUML_DAEMON_POOL_SIZE", 2),
+                timeout=render_timeout(),
+                health_interval=_env_float(
+                    "CODOC_PLANTUML_DAEMON_HEALTH_INTERVAL", 30.0
+                ),
+            )
+            atexit.register(_pool.close)
+        return _pool
+
+
+registry.callback(
+    "codoc_plantuml_jvm_restarts_total",
+    "PlantUML daemon JVMs restarted after a crash, timeout or failed health check.",
+    lambda: _pool.restarts if _pool is not None else 0,
+    type="counter",
+)
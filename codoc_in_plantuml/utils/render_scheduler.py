@@ -0,0 +1,98 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import TypeVar
+
+from codoc_in_plantuml.utils.metrics import registry
+
+T = TypeVar("T")
+
+
+@dataclass
+class _Room:
+    running: bool = False
+    pending: asyncio.Future | None = None
+    latest: int = 0
+    current: int = 0
+
+
+class RenderScheduler:
+    """Latest-wins render queue with one running and one pending job per room.
+
+    Submitting while a render is running parks the new job as the room's
+    pending job, replacing (and dropping) any job that was already waiting.
+    A job whose result was overtaken by a newer submission returns ``None``.
+    """
+
+    def __init__(self):
+        self.superseded = 0
+        self._rooms: dict[str, _Room] = {}
+
+    async def submit(self, room_id: str, job: Callable[[], Awaitable[T]]) -> T | None:
+        room = self._rooms.setdefault(room_id, _Room())
+        room.latest += 1
+        ticket = room.latest
+        if room.running:
+            if room.pending is not None:
+                room.pending.set_result(False)
+                self.superseded += 1
+            turn = asyncio.get_running_loop().create_future()
+            room.pending = turn
+            try:
+                if not await turn:
+                    return None
+            except asyncio.CancelledError:
+                if room.pending is turn:
+                    room.pending = None
+                    # Nothing newer is queued, so the running job is current again.
+                    room.latest = room.current
+                elif turn.done() and turn.result():
+                    # We were handed the room but will not use it.
+                    self._release(room_id, room)
+                raise
+        else:
+            room.running = True
+        room.current = ticket
+        try:
+            result = await job()
+        finally:
+            self._release(room_id, room)
+        if ticket != room.latest:
+            self.superseded += 1
+            return None
+        return result
+
+    def _release(self, room_id: str, room: _Room) -> None:
+        if room.pending is not None:
+            # Hand the room straight to the waiting job so nothing can sneak in.
+            turn, room.pending = room.pending, None
+            turn.set_result(True)
+            return
+        room.running = False
+        if self._rooms.get(room_id) is room:
+            del self._rooms[room_id]
+
+    def depth(self, room_id: str) -> int:
+        """Number of running plus pending renders for a room (0, 1 or 2)."""
+        room = self._rooms.get(room_id)
+        if room is None:
+            return 0
+        return int(room.running) + int(room.pending is not None)
+
+    def queue_depth(self) -> int:
+        return sum(self.depth(room_id) for room_id in list(self._rooms))
+
+
+render_scheduler = RenderScheduler()
+
+registry.callback(
+    "codoc_plantuml_render_queue_depth",
+    "Running plus pending preview renders across all rooms.",
+    render_scheduler.queue_depth,
+)
+registry.callback(
+    "codoc_plantuml_renders_superseded_total",
+    "Preview renders dropped because a newer edit in the room replaced them.",
+    lambda: render_scheduler.superseded,
+    type="counter",
+)
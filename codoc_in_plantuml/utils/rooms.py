@@ -0,0 +1,78 @@
+import os
+import time
+from collections import OrderedDict
+
+from codoc_in_plantuml.utils.metrics import registry
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, ""))
+    except ValueError:
+        return default
+
+
+def room_ttl() -> float:
+    """Seconds without activity after which a room is evicted."""
+    return _env_float("CODOC_PLANTUML_ROOM_TTL", 1800.0)
+
+
+def room_budget() -> int:
+    """Approximate bytes all rooms together may hold before the least
+    recently used are evicted."""
+    return int(_env_float("CODOC_PLANTUML_ROOM_MEMORY_MB", 256.0) * 1024 * 1024)
+
+
+# Evicted rooms remembered at most. A room forgotten here is still reloaded
+# if the state manager hands back a fresh state for it; only an older copy
+# it kept on disk would go unnoticed.
+_EVICTED_LIMIT = 10_000
+
+
+class RoomTracker:
+    """Last activity of every room held in this process.
+
+    Evicted rooms are remembered until their next access (the most recent
+    ``evicted_limit`` of them), so that whatever state the state manager
+    hands back for them then can be reloaded from the document store.
+    """
+
+    def __init__(self, evicted_limit: int = _EVICTED_LIMIT):
+        self.evicted_limit = evicted_limit
+        self._last: OrderedDict[str, float] = OrderedDict()
+        self._evicted: OrderedDict[str, None] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._last)
+
+    def touch(self, room: str) -> bool:
+        """Record activity in ``room``; True if it was evicted since last seen."""
+        self._last[room] = time.monotonic()
+        self._last.move_to_end(room)
+        if room in self._evicted:
+            del self._evicted[room]
+            return True
+        return False
+
+    def last_active(self, room: str) -> float | None:
+        return self._last.get(room)
+
+    def least_recent(self) -> list[tuple[str, float]]:
+        """Rooms with their last activity, least recently active first."""
+        return list(self._last.items())
+
+    def evicted(self, room: str) -> None:
+        self._last.pop(room, None)
+        self._evicted[room] = None
+        self._evicted.move_to_end(room)
+        while len(self._evicted) > self.evicted_limit:
+            self._evicted.popitem(last=False)
+
+
+rooms = RoomTracker()
+
+registry.callback(
+    "codoc_plantuml_rooms",
+    "Document rooms currently held in memory.",
+    lambda: len(rooms),
+)
@@ -0,0 +1,67 @@
+import threading
+from collections.abc import Callable, Hashable
+from concurrent.futures import Executor, Future
+from typing import Any
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one execution.
+
+    The first caller for a key starts the work; callers arriving while it is
+    still in flight receive the same future instead of starting their own.
+    """
+
+    def __init__(self):
+        self.started = 0
+        self.joined = 0
+        self._futures: dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def _join_or_lead(self, key: Hashable) -> tuple[Future, bool]:
+        with self._lock:
+            future = self._futures.get(key)
+            if future is not None:
+                self.joined += 1
+                return future, False
+            future = Future()
+            self._futures[key] = future
+            self.started += 1
+            return future, True
+
+    def _forget(self, key: Hashable, future: Future) -> None:
+        with self._lock:
+            if self._futures.get(key) is future:
+                del self._futures[key]
+
+    def _run_into(self, key: Hashable, future: Future, fn: Callable, args) -> None:
+        if not future.set_running_or_notify_cancel():
+            self._forget(key, future)
+            return
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            self._forget(key, future)
+
+    def run(self, key: Hashable, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run ``fn`` in the calling thread unless the key is already in flight."""
+        future, leader = self._join_or_lead(key)
+        if leader:
+            self._run_into(key, future, fn, args)
+        return future.result()
+
+    def submit(
+        self, key: Hashable, executor: Executor, fn: Callable[..., Any], *args: Any
+    ) -> Future:
+        """Schedule ``fn`` on ``executor`` unless the key is already in flight."""
+        future, leader = self._join_or_lead(key)
+        if leader:
+            executor.submit(self._run_into, key, future, fn, args)
+        return future
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._futures)
@@ -0,0 +1,262 @@
+"""Operational transformation for plain text.
+
+An operation walks the whole document once: a positive int retains that many
+characters, a negative int deletes that many and a string inserts itself.
+This is the ot.js ``TextOperation`` model; the browser side in
+``components/collab_sync.js`` implements the same functions so both ends
+transform identically.
+
+Lengths are counted in UTF-16 code units, as in JavaScript and Monaco, so
+offsets agree with the editor for text outside the Basic Multilingual Plane.
+"""
+
+Op = int | str
+
+
+def text_length(text: str) -> int:
+    """Length of ``text`` in UTF-16 code units."""
+    if text.isascii():
+        return len(text)
+    return len(text.encode("utf-16-le")) // 2
+
+
+class TextOperation:
+    def __init__(self):
+        self.ops: list[Op] = []
+        self.base_length = 0
+        self.target_length = 0
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, TextOperation) and self.ops == other.ops
+
+    def __repr__(self) -> str:
+        return f"TextOperation({self.ops!r})"
+
+    def retain(self, n: int) -> "TextOperation":
+        if n <= 0:
+            return self
+        self.base_length += n
+        self.target_length += n
+        if self.ops and _is_retain(self.ops[-1]):
+            self.ops[-1] += n
+        else:
+            self.ops.append(n)
+        return self
+
+    def insert(self, text: str) -> "TextOperation":
+        if not text:
+            return self
+        self.target_length += text_length(text)
+        ops = self.ops
+        if ops and isinstance(ops[-1], str):
+            ops[-1] += text
+        elif ops and _is_delete(ops[-1]):
+            # Keep inserts before deletes so equal operations compare equal.
+            if len(ops) > 1 and isinstance(ops[-2], str):
+                ops[-2] += text
+            else:
+                ops.insert(len(ops) - 1, text)
+        else:
+            ops.append(text)
+        return self
+
+    def delete(self, n: int) -> "TextOperation":
+        if n <= 0:
+            return self
+        self.base_length += n
+        if self.ops and _is_delete(self.ops[-1]):
+            self.ops[-1] -= n
+        else:
+            self.ops.append(-n)
+        return self
+
+    def is_noop(self) -> bool:
+        return not self.ops or (len(self.ops) == 1 and _is_retain(self.ops[0]))
+
+    @classmethod
+    def from_json(cls, ops: list) -> "TextOperation":
+        """Build an operation from its wire form, rejecting malformed input."""
+        if not isinstance(ops, list):
+            raise ValueError("operation must be a list")
+        operation = cls()
+        for op in ops:
+            if isinstance(op, bool) or not isinstance(op, (int, str)):
+                raise ValueError(f"invalid operation component: {op!r}")
+            if isinstance(op, str):
+                operation.insert(op)
+            elif op > 0:
+                operation.retain(op)
+            elif op < 0:
+                operation.delete(-op)
+            else:
+                raise ValueError("zero-length operation component")
+        return operation
+
+    def to_json(self) -> list[Op]:
+        return list(self.ops)
+
+    @classmethod
+    def replace(cls, old: str, new: str) -> "TextOperation":
+        """The smallest single-range operation turning ``old`` into ``new``."""
+        prefix = 0
+        limit = min(len(old), len(new))
+        while prefix < limit and old[prefix] == new[prefix]:
+            prefix += 1
+        suffix = 0
+        limit -= prefix
+        while suffix < limit and old[-1 - suffix] == new[-1 - suffix]:
+            suffix += 1
+        return (
+            cls()
+            .retain(text_length(old[:prefix]))
+            .delete(text_length(old[prefix : len(old) - suffix]))
+            .insert(new[prefix : len(new) - suffix])
+            .retain(text_length(old[len(old) - suffix :]))
+        )
+
+    def apply(self, text: str) -> str:
+        """``text`` with the operation applied.
+
+        Raises ValueError if the operation does not fit ``text``, including
+        when one of its boundaries splits a surrogate pair.
+        """
+        if text.isascii():
+            return self._apply_units(text, text)
+        units = text.encode("utf-16-le")
+        return self._apply_units(units, text)
+
+    def _apply_units(self, units: str | bytes, text: str) -> str:
+        # ``units`` is either the text itself (ASCII, one unit per character)
+        # or its UTF-16-LE bytes (two bytes per unit).
+        width = 1 if isinstance(units, str) else 2
+        if len(units) // width != self.base_length:
+            raise ValueError(
+                f"operation expects a document of length {self.base_length}, "
+                f"got {len(units) // width}"
+            )
+        parts = []
+        index = 0
+        for op in self.ops:
+            if isinstance(op, str):
+                parts.append(op if width == 1 else op.encode("utf-16-le"))
+            elif op > 0:
+                parts.append(units[index * width : (index + op) * width])
+                index += op
+            else:
+                index -= op
+        if width == 1:
+            return "".join(parts)
+        try:
+            return b"".join(parts).decode("utf-16-le")
+        except UnicodeDecodeError:
+            raise ValueError("operation splits a surrogate pair") from None
+
+    def compose(self, other: "TextOperation") -> "TextOperation":
+        """One operation with the effect of applying ``self`` then ``other``."""
+        if self.target_length != other.base_length:
+            raise ValueError("the base length of the second operation must match")
+        result = TextOperation()
+        ops1, ops2 = iter(self.ops), iter(other.ops)
+        op1, op2 = next(ops1, None), next(ops2, None)
+        while op1 is not None or op2 is not None:
+            if op1 is not None and _is_delete(op1):
+                result.delete(-op1)
+                op1 = next(ops1, None)
+                continue
+            if isinstance(op2, str):
+                result.insert(op2)
+                op2 = next(ops2, None)
+                continue
+            if op1 is None or op2 is None:
+                raise ValueError("operations do not compose")
+            if _is_retain(op1) and _is_retain(op2):
+                n = min(op1, op2)
+                result.retain(n)
+                op1, op2 = _advance(op1, n, ops1), _advance(op2, n, ops2)
+            elif isinstance(op1, str) and _is_delete(op2):
+                n = min(text_length(op1), -op2)
+                op1, op2 = _advance(op1, n, ops1), _advance(op2, n, ops2)
+            elif isinstance(op1, str) and _is_retain(op2):
+                n = min(text_length(op1), op2)
+                result.insert(_take(op1, n))
+                op1, op2 = _advance(op1, n, ops1), _advance(op2, n, ops2)
+            else:
+                # Retain in ``self``, delete in ``other``.
+                n = min(op1, -op2)
+                result.delete(n)
+                op1, op2 = _advance(op1, n, ops1), _advance(op2, n, ops2)
+        return result
+
+    @staticmethod
+    def transform(
+        a: "TextOperation", b: "TextOperation"
+    ) -> tuple["TextOperation", "TextOperation"]:
+        """Transform concurrent ``a`` and ``b`` into ``(a', b')``.
+
+        ``b.apply(a.apply(doc))`` and ``a.apply(b.apply(doc))`` are equal
+        after ``a`` is followed by ``b'`` and ``b`` by ``a'``. Inserts at
+        the same position put ``a``'s text first.
+        """
+        if a.base_length != b.base_length:
+            raise ValueError("concurrent operations must have the same base length")
+        a_prime, b_prime = TextOperation(), TextOperation()
+        ops1, ops2 = iter(a.ops), iter(b.ops)
+        op1, op2 = next(ops1, None), next(ops2, None)
+        while op1 is not None or op2 is not None:
+            if isinstance(op1, str):
+                a_prime.insert(op1)
+                b_prime.retain(text_length(op1))
+                op1 = next(ops1, None)
+                continue
+            if isinstance(op2, str):
+                a_prime.retain(text_length(op2))
+                b_prime.insert(op2)
+                op2 = next(ops2, None)
+                continue
+            if op1 is None or op2 is None:
+                raise ValueError("operations do not transform")
+            if _is_retain(op1) and _is_retain(op2):
+                n = min(op1, op2)
+                a_prime.retain(n)
+                b_prime.retain(n)
+            elif _is_delete(op1) and _is_delete(op2):
+                # Both deleted the same text.
+                n = min(-op1, -op2)
+            elif _is_delete(op1):
+                n = min(-op1, op2)
+                a_prime.delete(n)
+            else:
+                n = min(op1, -op2)
+                b_prime.delete(n)
+            op1, op2 = _advance(op1, n, ops1), _advance(op2, n, ops2)
+        return a_prime, b_prime
+
+
+def _is_retain(op: Op) -> bool:
+    return isinstance(op, int) and op > 0
+
+
+def _is_delete(op: Op) -> bool:
+    return isinstance(op, int) and op < 0
+
+
+def _take(text: str, n: int) -> str:
+    """The first ``n`` UTF-16 code units of ``text``."""
+    if text.isascii():
+        return text[:n]
+    units = text.encode("utf-16-le")[: 2 * n]
+    return units.decode("utf-16-le", errors="surrogatepass")
+
+
+def _advance(op: Op, n: int, rest) -> Op | None:
+    """``op`` with ``n`` units consumed, or the next component when used up."""
+    if isinstance(op, str):
+        if text_length(op) == n:
+            return next(rest, None)
+        if op.isascii():
+            return op[n:]
+        units = op.encode("utf-16-le")[2 * n :]
+        return units.decode("utf-16-le", errors="surrogatepass")
+    if op > 0:
+        return op - n if op > n else next(rest, None)
+    return op + n if op < -n else next(rest, None)
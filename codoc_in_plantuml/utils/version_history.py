@@ -0,0 +1,195 @@
+"""Per-document version history, stored next to the document store.
+
+Every applied edit batch becomes a revision. Revisions point at
+content-addressed blobs, so a text that comes back (an undo, a reloaded
+example) is stored once. A blob is either a full snapshot or a line-level
+delta against the previous revision's blob; chains of deltas are at most
+``max_deltas`` long, so any revision is rebuilt from one snapshot plus at
+most that many deltas. Blobs are raw-deflate compressed.
+"""
+
+import hashlib
+import json
+import sqlite3
+import time
+import zlib
+from collections import OrderedDict
+
+from codoc_in_plantuml.utils.text_ops import Op
+
+HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    id INTEGER PRIMARY KEY,
+    hash BLOB NOT NULL UNIQUE,
+    base INTEGER,
+    depth INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS revisions (
+    room TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    blob INTEGER NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (room, version)
+) WITHOUT ROWID;
+"""
+
+_CHAIN_SQL = """
+WITH RECURSIVE chain (id, base, depth, data) AS (
+    SELECT id, base, depth, data FROM blobs WHERE id = ?
+    UNION ALL
+    SELECT blobs.id, blobs.base, blobs.depth, blobs.data
+    FROM blobs JOIN chain ON blobs.id = chain.base
+)
+SELECT depth, data FROM chain ORDER BY depth
+"""
+
+# Last recorded text per room, kept so the next revision can be stored as a
+# delta against it. Rooms missing here start a new chain with a snapshot.
+_TIP_CACHE_SIZE = 64
+
+
+def content_hash(text: str) -> bytes:
+    return hashlib.blake2b(
+        text.encode("utf-8", "surrogatepass"), digest_size=16
+    ).digest()
+
+
+def _compress(data: bytes) -> bytes:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _decompress(data: bytes) -> bytes:
+    return zlib.decompress(data, -15)
+
+
+def _units_to_chars(text: str, units: int, from_end: bool = False) -> int:
+    """Characters covering ``units`` UTF-16 code units at either end of ``text``."""
+    if text.isascii():
+        return units
+    encoded = text.encode("utf-16-le", "surrogatepass")
+    part = encoded[len(encoded) - 2 * units :] if from_end else encoded[: 2 * units]
+    return len(part.decode("utf-16-le", "surrogatepass"))
+
+
+def line_delta(old: str, new: str, ops: list[Op]) -> tuple[int, int, list[str]]:
+    """The lines of ``old`` that ``ops`` replaced, as ``(start, count, lines)``.
+
+    The operation's leading and trailing retains bound the change, so only
+    the touched lines are looked at, however long the document is.
+    """
+    prefix = ops[0] if ops and isinstance(ops[0], int) and ops[0] > 0 else 0
+    suffix = ops[-1] if len(ops) > 1 and isinstance(ops[-1], int) and ops[-1] > 0 else 0
+    prefix = _units_to_chars(old, prefix)
+    suffix = _units_to_chars(old, suffix, from_end=True)
+    line_start = old.rfind("\n", 0, prefix) + 1
+    old_end = old.find("\n", len(old) - suffix)
+    old_end = len(old) if old_end < 0 else old_end
+    new_end = new.find("\n", len(new) - suffix)
+    new_end = len(new) if new_end < 0 else new_end
+    return (
+        old.count("\n", 0, line_start),
+        old.count("\n", line_start, old_end) + 1,
+        new[line_start:new_end].split("\n"),
+    )
+
+
+class VersionHistory:
+    """Writes and reads revisions; the writer side runs on one thread."""
+
+    def __init__(self, max_deltas: int = 128):
+        self.max_deltas = max_deltas
+        # room -> (version, text, blob id, depth) of its newest revision.
+        self._tips: OrderedDict[str, tuple[int, str, int, int]] = OrderedDict()
+
+    def record(
+        self,
+        db: sqlite3.Connection,
+        room: str,
+        version: int,
+        text: str,
+        ops: list[Op] | None = None,
+        created: float | None = None,
+    ) -> None:
+        """Store ``text`` as ``room``'s revision ``version``.
+
+        ``ops`` is the operation that produced it from revision
+        ``version - 1``; without it, or without that revision at hand, the
+        text starts a new chain.
+        """
+        digest = content_hash(text)
+        tip = self._tips.pop(room, None)
+        row = db.execute(
+            "SELECT id, depth FROM blobs WHERE hash = ?", (digest,)
+        ).fetchone()
+        if row is not None:
+            blob, depth = row
+        elif (
+            tip is not None
+            and ops
+            and tip[0] == version - 1
+            and tip[3] < self.max_deltas
+        ):
+            _, old, base, base_depth = tip
+            delta = json.dumps(line_delta(old, text, ops), separators=(",", ":"))
+            depth = base_depth + 1
+            blob = db.execute(
+                "INSERT INTO blobs (hash, base, depth, data) VALUES (?, ?, ?, ?)",
+                (digest, base, depth, _compress(delta.encode("utf-8", "surrogatepass"))),
+            ).lastrowid
+        else:
+            depth = 0
+            blob = db.execute(
+                "INSERT INTO blobs (hash, depth, data) VALUES (?, 0, ?)",
+                (digest, _compress(text.encode("utf-8", "surrogatepass"))),
+            ).lastrowid
+        db.execute(
+            "INSERT OR REPLACE INTO revisions VALUES (?, ?, ?, ?)",
+            (room, version, blob, time.time() if created is None else created),
+        )
+        self._tips[room] = (version, text, blob, depth)
+        while len(self._tips) > _TIP_CACHE_SIZE:
+            self._tips.popitem(last=False)
+
+    def reset(self) -> None:
+        """Forget every tip, e.g. after the transaction recording them failed."""
+        self._tips.clear()
+
+    @staticmethod
+    def versions(
+        db: sqlite3.Connection, room: str, limit: int = 100, before: int | None = None
+    ) -> list[dict]:
+        """Newest revisions of ``room`` first, optionally older than ``before``."""
+        rows = db.execute(
+            "SELECT version, created, hash FROM revisions "
+            "JOIN blobs ON blobs.id = revisions.blob "
+            "WHERE room = ? AND version < ? ORDER BY version DESC LIMIT ?",
+            (room, before if before is not None else 2**62, limit),
+        ).fetchall()
+        return [
+            {"version": version, "created": created, "hash": digest.hex()}
+            for version, created, digest in rows
+        ]
+
+    @staticmethod
+    def load(db: sqlite3.Connection, room: str, version: int) -> str | None:
+        row = db.execute(
+            "SELECT blob FROM revisions WHERE room = ? AND version = ?",
+            (room, version),
+        ).fetchone()
+        if row is None:
+            return None
+        return VersionHistory.load_blob(db, row[0])
+
+    @staticmethod
+    def load_blob(db: sqlite3.Connection, blob: int) -> str | None:
+        """Rebuild a text from its snapshot and the deltas on top of it."""
+        chain = db.execute(_CHAIN_SQL, (blob,)).fetchall()
+        if not chain or chain[0][0] != 0:
+            return None
+        lines = _decompress(chain[0][1]).decode("utf-8", "surrogatepass").split("\n")
+        for _, data in chain[1:]:
+            start, count, new_lines = json.loads(_decompress(data))
+            lines[start : start + count] = new_lines
+        return "\n".join(lines)